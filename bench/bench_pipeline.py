@@ -0,0 +1,337 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+=============================================================
+ Offline benchmark — parse / clean / dedupe / classify
+
+ Builds synthetic M3U corpora (10k / 100k / 1M entries) and a
+ synthetic iptv-org channels.csv, modelled on the committed
+ list.m3u and channels.json, then times every stage of update_iptv.py in
+ isolation and end to end. No network access.
+
+   python bench/bench_pipeline.py                   # all sizes
+   python bench/bench_pipeline.py --sizes 10k,100k  # quicker
+   python bench/bench_pipeline.py --save-baseline   # new reference
+
+ Results are compared per stage (µs per item) with
+ bench/baseline.json; a stage slower than the baseline by more
+ than --threshold is flagged and the exit status is 1.
+ Baselines are machine specific: save one on the machine you
+ compare on before trusting the flags.
+=============================================================
+"""
+
+import os
+import io
+import sys
+import gc
+import json
+import time
+import random
+import platform
+import argparse
+import tracemalloc
+import contextlib
+
+from datetime import datetime
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.dirname(HERE)
+sys.path.insert(0, ROOT)
+
+import update_iptv as U  # noqa: E402
+
+BASELINE_FILE = os.path.join(HERE, "baseline.json")
+SIZES = {"10k": 10_000, "100k": 100_000, "1m": 1_000_000}
+DB_ROWS = 40_000  # about the size of the real iptv-org channels.csv
+SEED = 20240501
+
+# =============================================================
+# CORPUS — distributions taken from the committed list.m3u / channels.json
+# =============================================================
+
+QUALITY = ["", "", "", "", " (720p)", " (1080p)", " (576p)", " (480p)", " HD", " FHD"]
+TAGS = ["", "", "", "", "", "", " [Geo-blocked]", " [Not 24/7]"]
+LANGUAGES = ["Kurdish", "Central Kurdish", "Persian", "Arabic", "Turkish",
+             "English", "French", "Spanish", "Dari", "Kurdish;Arabic"]
+GROUP_TITLES = ["News", "Movies", "Music", "Kids", "Documentary", "Entertainment",
+                "General", "Sports", "Religious", "Series", "Undefined", ""]
+DB_CATEGORIES = ["movies", "series", "music", "news", "business", "kids",
+                 "animation", "family", "documentary", "science", "culture",
+                 "travel", "general", "sports", "religious", "entertainment"]
+COUNTRIES = ["IQ", "IR", "TR", "US", "GB", "FR", "DE", "AF", "SY", "SA", "AE", "ES"]
+
+
+def load_model():
+    """Names, tvg-ids, logos and stream hosts of the committed playlist;
+    the group mix and the share of channels with a logo of their own from
+    the committed channels.json"""
+    with open(os.path.join(ROOT, "list.m3u"), encoding="utf-8") as f:
+        entries = U.parse_m3u(f.read(), "model")
+    with open(os.path.join(ROOT, "channels.json"), encoding="utf-8") as f:
+        channels = json.load(f)
+    names = sorted({U.clean_name(e.name) for e in entries})
+    words = sorted({w for n in names for w in n.split() if w.isalpha()})
+    ids = sorted({e.tvg_id for e in entries if e.tvg_id})
+    logos = sorted({e.tvg_logo for e in entries if e.tvg_logo})
+    hosts = sorted({e.url.split("/")[2] for e in entries if e.url.startswith("http")})
+    groups = channels["groups"]
+    return {"names": names, "words": words, "ids": ids, "logos": logos, "hosts": hosts,
+            "with_id": sum(1 for e in entries if e.tvg_id) / len(entries),
+            "with_logo": sum(1 for c in channels["channels"] if c["logo"] != U.BRAND_LOGO)
+                         / len(channels["channels"]),
+            "groups": (list(groups), list(groups.values()))}
+
+
+def make_corpus(model, n, rng):
+    """(m3u text, tvg-ids used) with n entries. Most names are new word
+    combinations; a quarter reuse real names with quality / tag variants,
+    and one URL in ten repeats an earlier one (URL dedupe has work)."""
+    out, urls, ids = ["#EXTM3U\n"], [], set()
+    names, words, logos, hosts = model["names"], model["words"], model["logos"], model["hosts"]
+    for i in range(n):
+        if rng.random() < 0.25:
+            base = rng.choice(names)
+        else:
+            base = " ".join(rng.choice(words) for _ in range(rng.randint(1, 3))).title()
+            if rng.random() < 0.3:
+                base += rng.choice([" TV", " News", " Music", " Kids", " Movies", " 24"])
+        name = base + rng.choice(QUALITY) + rng.choice(TAGS)
+
+        attrs = []
+        if rng.random() < model["with_id"]:
+            tid = (rng.choice(model["ids"]) if rng.random() < 0.3 else
+                   f"{base.replace(' ', '')}.{rng.choice(COUNTRIES).lower()}@SD")
+            ids.add(tid)
+            attrs.append(f'tvg-id="{tid}"')
+        if rng.random() < model["with_logo"]:
+            attrs.append(f'tvg-logo="{rng.choice(logos)}"')
+        if rng.random() < 0.2:
+            attrs.append(f'tvg-language="{rng.choice(LANGUAGES)}"')
+        # sources mostly use our groups' names, in our output's mix, plus
+        # titles of their own that classification has to see through
+        title = (rng.choices(*model["groups"])[0] if rng.random() < 0.7
+                 else rng.choice(GROUP_TITLES))
+        attrs.append(f'group-title="{title}"')
+
+        if urls and rng.random() < 0.1:
+            url = rng.choice(urls)
+        else:
+            ext = "m3u8" if rng.random() < 0.85 else rng.choice(["ts", "mpd", "mp4"])
+            url = f"https://{rng.choice(hosts)}/live/{i:x}/{rng.getrandbits(32):08x}/index.{ext}"
+            urls.append(url)
+        out.append(f"#EXTINF:-1 {' '.join(attrs)},{name}\n{url}\n")
+    return "".join(out), ids
+
+
+def make_db_csv(ids, rng):
+    """iptv-org style channels.csv covering the corpus' tvg-ids (those that
+    are not padded with random ones up to DB_ROWS)"""
+    rows = ["id,name,alt_names,network,owners,country,categories,is_nsfw,website"]
+    ids = sorted({i.split("@")[0] for i in ids})
+    while len(ids) < DB_ROWS:
+        ids.append(f"Synthetic{len(ids)}.{rng.choice(COUNTRIES).lower()}")
+    for tid in ids:
+        cats = ";".join(rng.sample(DB_CATEGORIES, rng.randint(0, 2)))
+        rows.append(f"{tid},{tid.split('.')[0]},,,,{rng.choice(COUNTRIES)},{cats},FALSE,")
+    return "\n".join(rows) + "\n"
+
+# =============================================================
+# STAGES — (name, setup, run): setup builds the stage's input
+# outside the clock, run returns the number of items done
+# =============================================================
+
+
+def _parsed(inp):
+    return U.parse_m3u(inp["text"], "bench")
+
+
+def _names(inp):
+    return [ch.name for ch in _parsed(inp)]
+
+
+def _clean_names(inp):
+    return [U.clean_name(ch.name) for ch in _parsed(inp)]
+
+
+def _classify_input(inp):
+    channels = _parsed(inp)
+    for ch in channels:
+        ch.name = U.clean_name(ch.name)
+    return channels, U.parse_db(inp["csv"])
+
+
+def run_parse(text):
+    return len(U.parse_m3u(text, "bench"))
+
+
+def run_parse_db(csv_text):
+    return len(U.parse_db(csv_text))
+
+
+def run_clean_name(names):
+    for n in names:
+        U.clean_name(n)
+    return len(names)
+
+
+def run_dedupe_key(names):
+    for n in names:
+        U.dedupe_key(n)
+    return len(names)
+
+
+def run_classify(arg):
+    channels, db = arg
+    for ch in channels:
+        U.classify(ch, db)
+    return len(channels)
+
+
+def run_end_to_end(inp):
+    """build_playlist() minus network and probing: parse, URL dedupe and
+    name cleanup, classify (serial), name-dedupe of the kept channels"""
+    db = U.parse_db(inp["csv"])
+    raw = U.parse_m3u(inp["text"], "bench")
+    seen, unique = set(), []
+    for ch in raw:
+        u = U.normalize_url(ch.url)
+        if u in seen:
+            continue
+        seen.add(u)
+        ch.name = U.clean_name(ch.name)
+        unique.append(ch)
+    best = {}
+    for ch in unique:
+        group, _ = U.classify(ch, db)
+        if group != "DROP":
+            best.setdefault(U.dedupe_key(ch.name) or U.dedupe_key(ch.url), ch)
+    return len(raw)
+
+
+STAGES = [
+    ("parse", lambda inp: inp["text"], run_parse),
+    ("parse_db", lambda inp: inp["csv"], run_parse_db),
+    ("clean_name", _names, run_clean_name),
+    ("dedupe_key", _clean_names, run_dedupe_key),
+    ("classify", _classify_input, run_classify),
+    ("end_to_end", lambda inp: inp, run_end_to_end),
+]
+
+
+def prepare(model, n, rng):
+    text, ids = make_corpus(model, n, rng)
+    return {"text": text, "csv": make_db_csv(ids, rng)}
+
+
+def measure(fn, arg, repeat, memory):
+    """best-of-repeat seconds, items, and peak traced MB (separate run)"""
+    best, items = None, 0
+    for _ in range(repeat):
+        gc.collect()
+        t = time.perf_counter()
+        items = fn(arg)
+        secs = time.perf_counter() - t
+        best = secs if best is None else min(best, secs)
+    peak = None
+    if memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(arg)
+        peak = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return best, items, peak
+
+# =============================================================
+# MAIN
+# =============================================================
+
+
+def compare(results, baseline, threshold):
+    """[(size, stage, base µs, now µs, ratio)] for stages over threshold"""
+    slow = []
+    for size, stages in results.items():
+        for name, r in stages.items():
+            base = baseline.get(size, {}).get(name)
+            if base and r["us_per_item"] > base["us_per_item"] * (1 + threshold):
+                slow.append((size, name, base["us_per_item"], r["us_per_item"],
+                             r["us_per_item"] / base["us_per_item"]))
+    return slow
+
+
+def main():
+    ap = argparse.ArgumentParser(description="offline pipeline benchmark")
+    ap.add_argument("--sizes", default="10k,100k,1m",
+                    help="comma list of " + ", ".join(SIZES))
+    ap.add_argument("--stages", default=",".join(n for n, _, _ in STAGES))
+    ap.add_argument("--repeat", type=int, default=3, help="best of N (1 for 1m)")
+    ap.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    ap.add_argument("--threshold", type=float, default=0.20,
+                    help="flag stages this much slower than baseline (0.20 = 20%%)")
+    ap.add_argument("--baseline", default=BASELINE_FILE)
+    ap.add_argument("--save-baseline", action="store_true")
+    ap.add_argument("--json", help="also write the results here")
+    args = ap.parse_args()
+
+    wanted = set(args.stages.split(","))
+    model = load_model()
+    print(f"MODEL: {len(model['names'])} names, {len(model['ids'])} tvg-ids, "
+          f"{len(model['hosts'])} hosts, {len(model['groups'][0])} groups, "
+          f"{100 * model['with_logo']:.0f}% with a logo")
+
+    results = {}
+    print(f"\n{'size':<6}{'stage':<12}{'seconds':>10}{'items/s':>12}{'µs/item':>10}{'peak MB':>10}")
+    for size in args.sizes.split(","):
+        rng = random.Random(SEED)  # same corpus every run
+        with contextlib.redirect_stdout(io.StringIO()):  # parse_db's log line
+            inp = prepare(model, SIZES[size], rng)
+        repeat = 1 if SIZES[size] >= 1_000_000 else args.repeat
+        results[size] = {}
+        for name, setup, fn in STAGES:
+            if name not in wanted:
+                continue
+            with contextlib.redirect_stdout(io.StringIO()):
+                arg = setup(inp)
+                secs, items, peak = measure(fn, arg, repeat, not args.no_memory)
+                del arg  # one stage's input in memory at a time
+            r = {"seconds": round(secs, 4), "items": items,
+                 "items_per_s": round(items / secs), "us_per_item": round(1e6 * secs / items, 3),
+                 "peak_mb": None if peak is None else round(peak, 1)}
+            results[size][name] = r
+            peak_s = "-" if peak is None else f"{peak:.1f}"
+            print(f"{size:<6}{name:<12}{secs:>10.3f}{r['items_per_s']:>12,}"
+                  f"{r['us_per_item']:>10.2f}{peak_s:>10}")
+        del inp
+
+    report = {
+        "meta": {"date": datetime.utcnow().isoformat(timespec="seconds"),
+                 "python": platform.python_version(), "machine": platform.machine(),
+                 "rules_version": U.RULES_VERSION},
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.save_baseline:
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+            f.write("\n")
+        print("\nBASELINE saved:", args.baseline)
+        return 0
+
+    if not os.path.exists(args.baseline):
+        print("\nBASELINE: none yet (run with --save-baseline)")
+        return 0
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    slow = compare(results, baseline["results"], args.threshold)
+    print(f"\nBASELINE: {baseline['meta']['date']} (python {baseline['meta']['python']})")
+    for size, name, base, now, ratio in slow:
+        print(f"  REGRESSION {size} {name}: {base:.2f} -> {now:.2f} µs/item (x{ratio:.2f})")
+    if not slow:
+        print(f"  no stage slower than +{100 * args.threshold:.0f}%")
+    return 1 if slow else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
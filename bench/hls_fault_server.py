@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+=============================================================
+ Fault-injecting HLS server for probe-engine load tests
+
+ One local aiohttp server plays thousands of stream endpoints
+ spread over many fake hosts (*.fault.test, resolved to
+ 127.0.0.1 by FaultResolver). Each endpoint has one behaviour
+ (KINDS) and a ground truth: would a viewer get video from it?
+
+   python bench/hls_fault_server.py --n 500 --manifest eps.json
+   curl --resolve h0.fault.test:PORT:127.0.0.1 http://h0.fault.test:PORT/ok/0/index.m3u8
+
+ bench/probe_load.py runs the real probe phase against it.
+=============================================================
+"""
+
+import json
+import time
+import random
+import socket
+import asyncio
+import argparse
+
+from aiohttp import web
+from aiohttp.abc import AbstractResolver
+
+# kind -> (truth: plays for a viewer, what the endpoint does)
+KINDS = {
+    "ok":            (True,  "healthy live HLS: master -> media -> TS segments"),
+    "slow":          (True,  "first byte after --slow seconds (inside the probe timeout)"),
+    "geo403":        (True,  "403 here; geo-blocked, plays elsewhere"),
+    "ratelimit":     (True,  "429 + Retry-After on the first hit, then healthy"),
+    "redirect":      (True,  "302 chain over three hosts, then healthy"),
+    "redirect_loop": (False, "302s that never end"),
+    "stall":         (False, "200 video/mp2t headers, then no body"),
+    "too_slow":      (False, "first byte after the probe timeout"),
+    "wrong_type":    (False, "200 text/html for a .ts URL"),
+    "html_playlist": (False, "200 text/html parking page at an .m3u8 URL"),
+    "dead_segments": (False, "playlists fine, every segment 404"),
+    "refused":       (False, "host up, port closed"),
+    "nxdomain":      (False, "host does not resolve"),
+}
+
+DEFAULT_MIX = {"ok": 55, "slow": 5, "geo403": 4, "ratelimit": 4, "redirect": 4,
+               "redirect_loop": 2, "stall": 3, "too_slow": 2, "wrong_type": 3,
+               "html_playlist": 3, "dead_segments": 5, "refused": 5, "nxdomain": 5}
+
+DOMAIN = "fault.test"
+SEGMENT = b"\x47" + b"\x00" * 187          # one MPEG-TS packet
+SEGMENT_BYTES = SEGMENT * 400               # ~75 KB, enough for a throughput sample
+TARGET_DURATION = 4
+REDIRECT_HOPS = 3
+
+
+def parse_mix(text):
+    """"ok=60,stall=5" -> {kind: weight}; unknown kinds are an error"""
+    mix = {}
+    for part in filter(None, text.split(",")):
+        kind, _, weight = part.partition("=")
+        if kind not in KINDS:
+            raise SystemExit(f"unknown kind {kind!r}: {', '.join(KINDS)}")
+        mix[kind] = float(weight or 1)
+    return mix
+
+
+def build_endpoints(n, hosts, mix, seed, port, closed_port):
+    """[{url, kind, truth}] — dead kinds live on hosts of their own, the way
+    whole servers die, so they never share a host with live endpoints"""
+    rng = random.Random(seed)
+    kinds, weights = list(mix), list(mix.values())
+    out = []
+    for i in range(n):
+        kind = rng.choices(kinds, weights)[0]
+        if kind == "refused":
+            host, p = f"down{i % hosts}.{DOMAIN}", closed_port
+        elif kind == "nxdomain":
+            host, p = f"nx{i % hosts}.{DOMAIN}", port
+        else:
+            host, p = f"h{rng.randrange(hosts)}.{DOMAIN}", port
+        name = "live.ts" if kind == "wrong_type" else "index.m3u8"
+        out.append({"url": f"http://{host}:{p}/{kind}/{i}/{name}",
+                    "kind": kind, "truth": KINDS[kind][0]})
+    return out
+
+
+def closed_port():
+    """A local port nothing listens on (bound, then released)"""
+    s = socket.socket()
+    s.bind(("127.0.0.1", 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+
+class FaultResolver(AbstractResolver):
+    """*.fault.test -> 127.0.0.1, except nx* which does not resolve"""
+
+    async def resolve(self, host, port=0, family=socket.AF_INET):
+        if not host.endswith(DOMAIN) or host.startswith("nx"):
+            raise OSError(f"{host}: name does not resolve")
+        return [{"hostname": host, "host": "127.0.0.1", "port": port,
+                 "family": socket.AF_INET, "proto": 0, "flags": socket.AI_NUMERICHOST}]
+
+    async def close(self):
+        pass
+
+# =============================================================
+# SERVER
+# =============================================================
+
+
+def master_playlist():
+    return ("#EXTM3U\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=800000,RESOLUTION=640x360\nv0.m3u8\n"
+            "#EXT-X-STREAM-INF:BANDWIDTH=2500000,RESOLUTION=1280x720\nv1.m3u8\n")
+
+
+def media_playlist():
+    seq = int(time.time()) // TARGET_DURATION  # a live window that moves
+    lines = ["#EXTM3U", "#EXT-X-VERSION:3", f"#EXT-X-TARGETDURATION:{TARGET_DURATION}",
+             f"#EXT-X-MEDIA-SEQUENCE:{seq}"]
+    for n in range(seq, seq + 3):
+        lines += [f"#EXTINF:{TARGET_DURATION}.0,", f"seg{n}.ts"]
+    return "\n".join(lines) + "\n"
+
+
+class FaultServer:
+    """aiohttp app serving /<kind>/<id>/<file> for every KINDS entry"""
+
+    def __init__(self, slow=1.0, too_slow=10.0, hosts=50):
+        self.slow, self.too_slow, self.hosts = slow, too_slow, hosts
+        self.requests = 0
+        self.seen = set()  # ratelimit endpoints that already got their 429
+        self.app = web.Application()
+        self.app.router.add_get("/{kind}/{id}/{file}", self.handle)  # + HEAD
+
+    async def start(self, port=0):
+        self.runner = web.AppRunner(self.app, access_log=None)
+        await self.runner.setup()
+        site = web.TCPSite(self.runner, "127.0.0.1", port)
+        await site.start()
+        self.port = self.runner.addresses[0][1]
+        return self.port
+
+    async def stop(self):
+        await self.runner.cleanup()
+
+    async def handle(self, req):
+        self.requests += 1
+        kind, ident, fn = req.match_info["kind"], req.match_info["id"], req.match_info["file"]
+        if kind not in KINDS:
+            raise web.HTTPNotFound()
+
+        if fn == "index.m3u8" or fn == "live.ts":  # entry point: the faults live here
+            if kind == "geo403":
+                raise web.HTTPForbidden()
+            if kind == "ratelimit" and ident not in self.seen:
+                self.seen.add(ident)
+                raise web.HTTPTooManyRequests(headers={"Retry-After": "1"})
+            if kind in ("redirect", "redirect_loop"):
+                hop = int(req.query.get("hop", "0"))
+                if kind == "redirect_loop" or hop < REDIRECT_HOPS:
+                    host = f"h{(int(ident) + hop + 1) % self.hosts}.{DOMAIN}"
+                    raise web.HTTPFound(f"http://{host}:{self.port}/{kind}/{ident}/{fn}"
+                                        f"?hop={hop + 1}")
+            if kind == "slow":
+                await asyncio.sleep(self.slow)
+            if kind == "too_slow":
+                await asyncio.sleep(self.too_slow)
+            if kind == "stall":
+                resp = web.StreamResponse(headers={"Content-Type": "video/mp2t"})
+                await resp.prepare(req)
+                await asyncio.sleep(3600)  # ends when the client gives up
+                return resp
+            if kind in ("wrong_type", "html_playlist"):
+                return web.Response(text="<html><body>This domain is for sale</body></html>",
+                                    content_type="text/html")
+            return web.Response(text=master_playlist(),
+                                content_type="application/vnd.apple.mpegurl")
+
+        if fn.endswith(".m3u8"):
+            return web.Response(text=media_playlist(),
+                                content_type="application/vnd.apple.mpegurl")
+        if fn.endswith(".ts"):
+            if kind == "dead_segments":
+                raise web.HTTPNotFound()
+            return self.segment(req)
+        raise web.HTTPNotFound()
+
+    @staticmethod
+    def segment(req):
+        body, status, headers = SEGMENT_BYTES, 200, {"Content-Type": "video/mp2t"}
+        rng = req.headers.get("Range", "")
+        if rng.startswith("bytes="):
+            start, _, end = rng[6:].partition("-")
+            start = int(start or 0)
+            end = min(int(end) if end else len(body) - 1, len(body) - 1)
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(body)}"
+            body, status = body[start:end + 1], 206
+        return web.Response(body=body, status=status, headers=headers)
+
+# =============================================================
+# MAIN
+# =============================================================
+
+
+async def serve(args):
+    server = FaultServer(args.slow, args.too_slow, args.hosts)
+    port = await server.start(args.port)
+    eps = build_endpoints(args.n, args.hosts, parse_mix(args.mix), args.seed,
+                          port, closed_port())
+    if args.manifest:
+        with open(args.manifest, "w", encoding="utf-8") as f:
+            json.dump(eps, f, indent=1)
+    print(f"FAULT SERVER: 127.0.0.1:{port}, {len(eps)} endpoints on *.{DOMAIN}"
+          + (f" -> {args.manifest}" if args.manifest else ""))
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await server.stop()
+
+
+def add_args(ap):
+    ap.add_argument("--n", type=int, default=2000, help="endpoints")
+    ap.add_argument("--hosts", type=int, default=50, help="fake hosts they spread over")
+    ap.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()),
+                    help="kind=weight,... of " + ", ".join(KINDS))
+    ap.add_argument("--slow", type=float, default=1.0, help="seconds for 'slow'")
+    ap.add_argument("--too-slow", type=float, default=10.0, help="seconds for 'too_slow'")
+    ap.add_argument("--seed", type=int, default=1)
+
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="fault-injecting HLS server")
+    add_args(ap)
+    ap.add_argument("--port", type=int, default=0)
+    ap.add_argument("--manifest", help="write the endpoint list (url, kind, truth) here")
+    try:
+        asyncio.run(serve(ap.parse_args()))
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+=============================================================
+ Import-time budget for update_iptv.py
+
+ Runs `python -X importtime -c "import update_iptv"` in fresh
+ interpreters and checks the best cumulative time against a
+ budget, and that the modules kept off the import path
+ (aiohttp) stay off it. Exit status 1 on a breach.
+
+   python bench/import_budget.py
+   python bench/import_budget.py --budget-ms 80 --runs 7
+=============================================================
+"""
+
+import os
+import sys
+import argparse
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODULE = "update_iptv"
+DEFERRED = ("aiohttp",)  # imported inside the functions that need them
+
+
+def importtime():
+    """(self µs, cumulative µs, {direct child: cumulative µs}, every module
+    imported) for MODULE in one fresh interpreter"""
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", f"import {MODULE}"],
+                         cwd=ROOT, capture_output=True, text=True, check=True).stderr
+    below, seen = [], set()  # the tree prints children before their parent
+    for line in out.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_us, cum_us, name = line[len("import time:"):].split("|")
+        if not self_us.strip().isdigit():  # header row
+            continue
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        name = name.strip()
+        seen.add(name)
+        if depth == 0 and name == MODULE:
+            children = {n: c for d, n, c in below if d == 1}
+            return int(self_us), int(cum_us), children, seen
+        below = [] if depth == 0 else below + [(depth, name, int(cum_us))]
+    raise SystemExit(f"{MODULE} not in -X importtime output")
+
+
+def main():
+    ap = argparse.ArgumentParser(description="import-time budget check")
+    ap.add_argument("--budget-ms", type=float, default=100.0,
+                    help="best cumulative import time allowed")
+    ap.add_argument("--runs", type=int, default=5, help="best of N interpreters")
+    args = ap.parse_args()
+
+    runs = [importtime() for _ in range(args.runs)]
+    self_us, cum_us, children, seen = min(runs, key=lambda r: r[1])
+    heaviest = sorted(children.items(), key=lambda x: -x[1])[:5]
+
+    print(f"IMPORT {MODULE}: {cum_us / 1000:.1f} ms cumulative, {self_us / 1000:.1f} ms own "
+          f"(best of {args.runs}, budget {args.budget_ms:.0f} ms)")
+    print("  heaviest:", ", ".join(f"{n} {c / 1000:.1f} ms" for n, c in heaviest))
+
+    failed = False
+    if cum_us / 1000 > args.budget_ms:
+        print(f"  OVER BUDGET by {cum_us / 1000 - args.budget_ms:.1f} ms")
+        failed = True
+    eager = [m for m in DEFERRED if m in seen]
+    if eager:
+        print("  imported eagerly again:", ", ".join(eager))
+        failed = True
+    if not failed:
+        print("  OK")
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+=============================================================
+ Probe-engine load test against the fault-injecting server
+
+ Starts bench/hls_fault_server.py in-process, then runs the
+ real check phase of update_iptv.py (check_stream() under one
+ ProbeLimiter, two sessions on one connector, results taken as
+ they finish) over every endpoint, and scores the outcomes
+ against the known ground truth.
+
+   python bench/probe_load.py --n 3000
+   python bench/probe_load.py --deep --mode head-then-get
+   python bench/probe_load.py --mix ok=50,ratelimit=50 --hosts 5
+
+ Reported: probes/s, HTTP requests/s, per-URL check latency
+ percentiles, and false-positive (dead, kept) / false-negative
+ (plays, dropped) rates, overall and per kind. "Blocked" (None)
+ counts as kept, as it does in the playlist.
+=============================================================
+"""
+
+import os
+import sys
+import json
+import asyncio
+import argparse
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import aiohttp  # noqa: E402
+
+import update_iptv as U  # noqa: E402
+from hls_fault_server import (FaultServer, FaultResolver, KINDS, add_args,  # noqa: E402
+                              build_endpoints, closed_port, parse_mix)
+
+
+def percentile(values, p):
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(p / 100 * len(values)))]
+
+
+async def run(args):
+    U.CHECK_TIMEOUT = args.timeout
+    U.PROBE_MODE = args.mode
+    U.DEEP_HLS = args.deep
+
+    server = FaultServer(args.slow, args.too_slow, args.hosts)
+    port = await server.start()
+    eps = build_endpoints(args.n, args.hosts, parse_mix(args.mix), args.seed,
+                          port, closed_port())
+    print(f"FAULT SERVER: 127.0.0.1:{port}, {len(eps)} endpoints, {args.hosts} hosts, "
+          f"timeout {args.timeout}s, mode {args.mode}, deep {'on' if args.deep else 'off'}")
+
+    # same wiring as build_playlist(): one limiter, one connector, two sessions
+    limiter = U.ProbeLimiter(args.concurrency)
+    conn = aiohttp.TCPConnector(limit=args.concurrency, resolver=FaultResolver())
+    loop = asyncio.get_running_loop()
+    outcomes, latency = [None] * len(eps), [0.0] * len(eps)
+    try:
+        async with aiohttp.ClientSession(connector=conn) as session, \
+                   aiohttp.ClientSession(connector=conn) as session_vlc:
+
+            async def probe(i):
+                t = loop.time()
+                ok, _ = await U.check_stream(session, session_vlc, limiter, eps[i]["url"])
+                if ok is U._SKIPPED:
+                    ok = False  # breaker: the last known result, and there is none here
+                return i, ok, loop.time() - t
+
+            t0 = loop.time()
+            tasks = [asyncio.create_task(probe(i)) for i in range(len(eps))]
+            for done, fut in enumerate(asyncio.as_completed(tasks), 1):
+                i, ok, secs = await fut
+                outcomes[i], latency[i] = ok, secs
+                if done % 500 == 0:
+                    print(f"  checked {done}/{len(tasks)}")
+            wall = loop.time() - t0
+    finally:
+        await server.stop()
+
+    # ---- score ----
+    per_kind = {}
+    for ep, ok in zip(eps, outcomes):
+        k = per_kind.setdefault(ep["kind"], {"n": 0, "kept": 0, "blocked": 0})
+        k["n"] += 1
+        k["kept"] += ok is not False
+        k["blocked"] += ok is None
+    dead = [ok for ep, ok in zip(eps, outcomes) if not ep["truth"]]
+    live = [ok for ep, ok in zip(eps, outcomes) if ep["truth"]]
+    fp = sum(1 for ok in dead if ok is not False)
+    fn = sum(1 for ok in live if ok is False)
+
+    print(f"\nPROBES: {len(eps)} in {wall:.1f}s = {len(eps) / wall:.0f}/s, "
+          f"{server.requests} HTTP requests = {server.requests / wall:.0f}/s")
+    print("LATENCY per URL (s): " + ", ".join(
+        f"p{p} {percentile(latency, p):.2f}" for p in (50, 90, 99)) +
+        f", max {max(latency):.2f}")
+    print(f"FALSE POSITIVES: {fp}/{len(dead)} dead kept ({100 * fp / max(len(dead), 1):.1f}%)")
+    print(f"FALSE NEGATIVES: {fn}/{len(live)} live dropped ({100 * fn / max(len(live), 1):.1f}%)")
+
+    print(f"\n{'kind':<15}{'truth':>6}{'n':>6}{'kept':>6}{'blocked':>8}{'wrong':>7}")
+    for kind in KINDS:
+        k = per_kind.get(kind)
+        if not k:
+            continue
+        truth = KINDS[kind][0]
+        wrong = k["n"] - k["kept"] if truth else k["kept"]
+        print(f"{kind:<15}{'live' if truth else 'dead':>6}{k['n']:>6}{k['kept']:>6}"
+              f"{k['blocked']:>8}{wrong:>7}")
+
+    for kind, st in sorted(U.PROBE_STATS.items()):
+        print(f"PROBES [{kind}]: {st['probes']}, {st['bytes'] / 1e6:.1f} MB body")
+    if U.DEEP_STATS:
+        print("DEEP HLS:", ", ".join(f"{k}={v}" for k, v in sorted(U.DEEP_STATS.items())))
+    throttled = limiter.report()
+    if throttled:
+        print("THROTTLED HOSTS:", len(throttled))
+    tripped = limiter.tripped()
+    if tripped:
+        print("HOSTS DOWN (breaker):", len(tripped), "hosts,",
+              sum(n for _, n in tripped), "URLs skipped")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "endpoints": len(eps), "wall_s": round(wall, 3),
+                "probes_per_s": round(len(eps) / wall, 1),
+                "requests_per_s": round(server.requests / wall, 1),
+                "latency_s": {f"p{p}": round(percentile(latency, p), 3) for p in (50, 90, 99)},
+                "false_positive_rate": fp / max(len(dead), 1),
+                "false_negative_rate": fn / max(len(live), 1),
+                "kinds": per_kind,
+            }, f, indent=2)
+
+
+def main():
+    ap = argparse.ArgumentParser(description="probe-engine load test")
+    add_args(ap)
+    ap.add_argument("--concurrency", type=int, default=U.CONCURRENCY)
+    ap.add_argument("--timeout", type=int, default=U.CHECK_TIMEOUT, help="CHECK_TIMEOUT")
+    ap.add_argument("--mode", default=U.PROBE_MODE, choices=["get", "head-then-get", "range"])
+    ap.add_argument("--deep", action="store_true", help="CHECK_DEEP_HLS on")
+    ap.add_argument("--json", help="also write the results here")
+    asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+=============================================================
+ Probe-store check: does the probe phase remember dead links?
+
+ Runs the real probe phase of update_iptv.py (build_playlist(),
+ with ingest() swapped for a fixed channel list) against
+ bench/hls_fault_server.py in a scratch directory, and checks
+ what ends up in the SQLite probe store:
+
+   - dead-by-timeout and refused URLs get a row (status and
+     latency NULL), and their streak grows run by run, so
+     their re-check interval backs off like any dead URL's
+   - a run cancelled mid-phase (as on SIGTERM) leaves those
+     results for the next run, which probes only the rest
+
+ Exit status 1 on a failed check.
+
+   python bench/probe_store_check.py
+   python bench/probe_store_check.py --verbose
+=============================================================
+"""
+
+import io
+import os
+import sys
+import asyncio
+import sqlite3
+import argparse
+import tempfile
+import contextlib
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.dirname(HERE))
+sys.path.insert(0, HERE)
+
+import update_iptv as U  # noqa: E402
+from hls_fault_server import FaultServer, closed_port  # noqa: E402
+
+TIMEOUT = 1     # CHECK_TIMEOUT for the run; too_slow answers after 3
+
+
+class RecordingStore(U.ProbeStore):
+    """ProbeStore that also notes every URL put into it"""
+    stored = []
+
+    def put(self, url, outcome, info, source=None):
+        RecordingStore.stored.append(url)
+        super().put(url, outcome, info, source)
+
+
+def corpus(port, refused_port, counts):
+    """[(name, url, kind)] in queue order; counts: [(kind, n)]"""
+    out = []
+    for kind, n in counts:
+        for _ in range(n):
+            i = len(out)
+            if kind == "refused":
+                url = f"http://localhost:{refused_port}/refused/{i}/index.m3u8"
+            else:
+                url = f"http://127.0.0.1:{port}/{kind}/{i}/index.m3u8"
+            out.append((f"Probe {i}", url, kind))
+    return out
+
+
+async def probe_phase(chans, verbose, cancel_when=None):
+    """build_playlist() over chans; with cancel_when(stored urls), the run
+    is cancelled (as SIGTERM does) once that returns True. Returns the
+    URLs stored by this run and whether it was interrupted."""
+    async def ingest():
+        return {}, [U.Channel(name, url, "bench", {"tvg-language": "Kurdish"})
+                    for name, url, _ in chans]
+
+    U.ingest = ingest
+    RecordingStore.stored = []
+    out = sys.stdout if verbose else io.StringIO()
+    with contextlib.redirect_stdout(out):
+        task = asyncio.create_task(U.build_playlist())
+        while cancel_when is not None and not task.done():
+            if cancel_when(RecordingStore.stored):
+                task.cancel()
+                break
+            await asyncio.sleep(0.05)
+        try:
+            await task
+        except asyncio.CancelledError:
+            return list(RecordingStore.stored), True
+    return list(RecordingStore.stored), False
+
+
+def rows(urls):
+    db = sqlite3.connect(U.PROBE_DB)
+    q = ("SELECT url, outcome, status, latency, fails, streak FROM probes WHERE url IN (%s)"
+         % ",".join("?" * len(urls)))
+    out = {r[0]: r[1:] for r in db.execute(q, urls)}
+    db.close()
+    return out
+
+
+def probes():
+    return sum(st["probes"] for st in U.PROBE_STATS.values())
+
+
+class Checks:
+    def __init__(self):
+        self.failed = 0
+
+    def __call__(self, ok, what):
+        print(f"  {'ok  ' if ok else 'FAIL'} {what}")
+        self.failed += not ok
+
+
+async def check_streak(server, check, verbose):
+    """dead-by-timeout / refused URLs are stored and build up a streak"""
+    chans = corpus(server.port, closed_port(),
+                   [("too_slow", 3), ("refused", 3), ("ok", 6)])
+    dead = [url for _, url, kind in chans if kind != "ok"]
+    base = U.RECHECK_BASE
+
+    await probe_phase(chans, verbose)
+    got = rows(dead)
+    check(len(got) == len(dead), f"run 1: {len(got)}/{len(dead)} dead URLs stored")
+    check(len(got) == len(dead) and
+          all(r[0] == 0 and r[1] is None and r[2] is None for r in got.values()),
+          "run 1: stored as dead, status / latency NULL")
+
+    U.RECHECK_BASE = 0  # every stored result comes due again
+    try:
+        await probe_phase(chans, verbose)
+    finally:
+        U.RECHECK_BASE = base
+    got = rows(dead)
+    check(len(got) == len(dead) and all(r[3] == 2 and r[4] == 2 for r in got.values()),
+          "run 2: fails 2, streak 2 (got fails/streak: "
+          + ", ".join(sorted({f"{r[3]}/{r[4]}" for r in got.values()})) + ")")
+
+    before = probes()
+    await probe_phase(chans, verbose)
+    check(probes() == before, f"run 3: nothing due, {probes() - before} probes sent")
+
+
+async def check_interrupted(server, check, verbose):
+    """an interrupted run keeps its finished probes, timeouts included"""
+    chans = corpus(server.port, closed_port(),
+                   [("too_slow", 2), ("refused", 2), ("ok", 8), ("too_slow", 12)])
+    urls = [url for _, url, _ in chans]
+    first = urls[:4]  # dead ones at the head of the queue
+    concurrency = U.CONCURRENCY
+    U.CONCURRENCY = 4  # keep the tail of the queue waiting
+    try:
+        stored, interrupted = await probe_phase(
+            chans, verbose, cancel_when=lambda got: set(first) <= set(got))
+    finally:
+        U.CONCURRENCY = concurrency
+    check(interrupted and len(stored) < len(urls),
+          f"run 1: cancelled after {len(stored)}/{len(urls)} URLs")
+    got = rows(urls)
+    check(set(got) == set(stored), f"run 1: {len(got)}/{len(stored)} finished probes on disk")
+    check(all(got.get(url, (None,))[0] == 0 for url in first),
+          "run 1: dead-by-timeout / refused results among them")
+
+    again, _ = await probe_phase(chans, verbose)
+    check(set(again) == set(urls) - set(stored),
+          f"run 2: probed only the {len(urls) - len(stored)} unfinished URLs "
+          f"({len(set(again) & set(stored))} repeated)")
+
+
+async def run(args):
+    U.CHECK_TIMEOUT = TIMEOUT
+    U.SEED_CHANNELS = []
+    U.BREAKER_THRESHOLD = 10 ** 6  # not what is under test here
+    U.ProbeStore = RecordingStore
+
+    server = FaultServer(slow=0.5, too_slow=TIMEOUT + 2)
+    await server.start()
+    check = Checks()
+    cwd = os.getcwd()
+    try:
+        for name, fn in [("dead links build up a streak", check_streak),
+                         ("an interrupted run is picked up", check_interrupted)]:
+            with tempfile.TemporaryDirectory() as scratch:
+                os.chdir(scratch)  # store, caches and outputs of the run
+                print(name)
+                try:
+                    await fn(server, check, args.verbose)
+                finally:
+                    os.chdir(cwd)
+    finally:
+        await server.stop()
+    print("OK" if not check.failed else f"{check.failed} check(s) failed")
+    return 1 if check.failed else 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description="probe-store check")
+    ap.add_argument("--verbose", action="store_true", help="show build_playlist() output")
+    return asyncio.run(run(ap.parse_args()))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
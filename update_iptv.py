@@ -2,7 +2,7 @@
 # -*- coding: utf-8 -*-
 """
 =============================================================
- Anon TV â€” IPTV Auto Builder
+ Anon TV — IPTV Auto Builder
  by Aram Moostafaye
  https://github.com/arammoostafaye/Iptv
 
@@ -18,827 +18,50 @@
 
 import os
 import re
+import sys
+import time
+import signal
 import csv
 import io
 import json
+import zlib
+import gzip
+import codecs
+import sqlite3
 import hashlib
 import asyncio
-import aiohttp
-import requests
 
 from datetime import datetime
+from urllib.parse import urlsplit, urljoin
+from concurrent.futures import ProcessPoolExecutor
 
-# =============================================================
-# CONFIG
-# =============================================================
-
-OUTPUT_FILE = "list.m3u"
-OUTPUT_JSON = "channels.json"
-CACHE_FILE  = "check_cache.json"
-
-TELEGRAM_TOKEN   = os.getenv("TELEGRAM_TOKEN")
-TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
-
-HEADERS = {"User-Agent": "Mozilla/5.0"}
-
-# Brand logo (used as fallback tvg-logo for channels without one)
-BRAND_LOGO = "https://raw.githubusercontent.com/arammoostafaye/Iptv/main/assets/logo.png"
-
-# Runtime knobs (all optional)
-CHECK_TIMEOUT = int(os.getenv("CHECK_TIMEOUT", "7"))       # seconds per stream probe
-CONCURRENCY   = int(os.getenv("CHECK_CONCURRENCY", "120")) # parallel probes
-IPTV_LIMIT    = int(os.getenv("IPTV_LIMIT", "0"))          # 0 = no limit (testing aid)
-SKIP_CHECK    = os.getenv("IPTV_SKIP_CHECK", "0") == "1"   # trust all (testing aid)
-
-# Rule: language folders win over genre folders (removes overlap).
-# e.g. iFilm -> Persian (not Movies), Rudaw -> Kurdish (not News).
-LANGUAGE_FIRST = True
-
-GROUP_ORDER = ["Kurdish", "Persian", "Movies", "Music", "News",
-               "Kids", "Documentary", "Other"]
-
-# =============================================================
-# SATELLITE CHANNEL DATABASE (from public frequency listings)
-# hint: kurdish | persian | other
-# =============================================================
-
-SATELLITES = {
-    "Nilesat 7.0W": {
-        "kurdish": [
-            "Rudaw", "Rudaw HD", "Kurdistan 24", "NRT", "NRT HD", "NRT2",
-            "NRT3", "NRT4", "Kurdsat", "Kurdsat HD", "Kurdsat News",
-            "Kurdmax", "Kurdmax Sorani", "Kurdmax Kurmanci", "Kurdmax Show",
-            "Kurdmax Show Kurmanci", "Kurdmax Music", "Kurdmax Pepule",
-            "Gali Kurdistan", "Zagros TV", "Khak TV", "Kirkuk TV", "Speda TV",
-            "Payam TV", "Waar TV", "Waar Cinema", "Net TV", "Newline HD",
-            "Afarin TV", "Rasan TV", "UTV Hawler", "Duhok TV", "Komala TV",
-            "Aso TV", "Aso Kids", "Tishk TV", "Judi TV", "Newroz TV",
-            "Amozhgary TV", "Cihan TV", "KNN TV", "Folklor TV", "Ezidxan TV",
-            "Kanal 4", "Freedom TV", "Ava TV", "Ava Entertainment", "ZED TV",
-        ],
-        "persian": [
-            "iFilm", "iFilm 2", "iFilm Persian", "iFilm Arabic", "MBC Persia",
-            "BBC Persian", "Iran International", "Azadi TV", "Manoto",
-            "Manoto HD", "Marjan TV",
-        ],
-        "other": [
-            "MBC 1", "MBC 2", "MBC 3", "MBC 4", "MBC Action", "MBC Drama",
-            "MBC Masr", "MBC Masr 2", "MBC Bollywood", "MBC Iraq",
-            "Rotana Cinema", "Rotana Khalijiah", "Rotana Music",
-            "Rotana Drama", "Rotana Kids", "Al Jazeera", "Al Jazeera English",
-            "Al Jazeera Mubasher", "Al Jazeera Documentary", "Al Arabiya",
-            "Al Arabiya Al Hadath", "BBC Arabic", "RT Arabic", "France 24 Arabic",
-            "CNBC Arabia", "Spacetoon", "Majid Kids", "Baraem", "Jeem TV",
-            "Toyor Al Janah", "Toyor Baby", "Cairo Drama", "Cairo Cinema",
-        ],
-    },
-    "Badr 26.0E": {
-        "kurdish": [
-            "Sahar Kurdish", "Kordestan TV", "Kermanshah TV", "Ilam TV",
-            "Urmia TV", "Sahand TV",
-        ],
-        "persian": [
-            "IRIB TV1", "IRIB TV2", "IRIB TV3", "IRIB TV4", "IRIB TV5",
-            "IRINN", "IRINN 2", "Varzesh TV", "Nasim TV", "Tamasha TV",
-            "Mostanad TV", "Ofogh TV", "Pooya TV", "Nahal TV", "Amouzesh TV",
-            "Quran TV", "Salamat TV", "Jame-Jam 1", "Jame-Jam 2", "Jame-Jam 3",
-            "iFilm Persian", "iFilm Arabic", "iFilm English", "Press TV",
-            "Press TV French", "Hispan TV", "Al-Alam", "Al-Kawthar",
-            "Sahar TV", "Shoma TV", "Omid TV", "Namayesh TV", "Tehran TV",
-        ],
-        "other": [
-            "Al Arabiya", "Al Hadath", "Al Ekhbariya", "MBC 1", "MBC 2",
-            "MBC 3", "MBC 4", "MBC Drama", "MBC Action",
-        ],
-    },
-    "Yahsat 52.5E": {
-        "kurdish": [
-            "Kurd Channel TV", "GEM Kurd", "Channel 8",
-        ],
-        "persian": [
-            "GEM TV", "GEM Series", "GEM Film", "GEM Classic", "GEM Drama",
-            "GEM Junior", "GEM River", "GEM Bollywood", "GEM Food", "GEM Life",
-            "BBC Persian", "Channel One", "HodHod Farsi", "Simaye Azadi",
-            "Shabakeh 7", "Ayeneh TV", "Marjaeyat TV", "Hambastegi TV",
-            "Vivana TV", "Mohabat TV", "TM TV Persian", "Afghanistan International",
-            # Persiana group + big Persian packages (10803H / 10845V / 11343H)
-            "Persiana TV", "Persiana 1", "Persiana One", "Persiana Two",
-            "Persiana Sports 1", "Persiana Sports 2", "Persiana Sports 3",
-            "Persiana Sports 4", "Persiana Junior", "Persiana Rap",
-            "Persiana China", "Persiana Voyage", "Persiana Podcast",
-            "Persian Cinema", "Navahang", "AVA Family", "AVA Series",
-            "Didar TV", "Saamen TV", "OXIR TV", "Your Time TV", "Sharq TV",
-            "Dunya Naw", "TV Farah", "20TV", "XO TV", "Radio Javan",
-            "Play Plus TV", "24Box TV", "Payam Aramesh", "RTA Afghanistan",
-        ],
-        "other": [],
-    },
-    "TurkmenAlem / MonacoSat 52.0E": {
-        "kurdish": [],
-        "persian": [
-            "TOLO TV", "TOLOnews", "Lemar TV", "Ariana TV", "ATN", "ATN News",
-            "Shamshad TV", "Khurshid TV", "1TV Afghanistan", "Hewad TV",
-            "Mitra TV", "Zan TV", "Tamadon TV", "Batur TV", "Arezo TV",
-            "Watan TV", "Negah TV", "Iman TV", "Noorin TV", "BBC Persian",
-            "Iran International",
-        ],
-        "other": [
-            "Altyn Asyr", "Turkmen Owazy", "Yaslyk", "Miras", "Asgabat TV",
-        ],
-    },
-    "Hotbird 13.0E": {
-        "kurdish": [
-            "Kurdsat", "Kurdsat News", "Sterk TV", "Ronahi TV", "Med Muzik",
-            "Medya Haber TV", "MMC", "Cira TV", "Newroz TV", "TV10",
-            "Zagros TV",
-        ],
-        "persian": [
-            "Manoto", "Iran International", "BBC Persian", "VOA Persian",
-            "Pars TV", "Channel One", "Tapesh TV", "Tapesh 2", "PMC",
-            "Radio Javan TV", "ITN", "Omid-e Iran", "Jaam-e-Jam International",
-            "Jame-Jam TV Network", "Nour TV", "Salaam TV", "Mihan TV",
-            "Nejat TV", "Kalameh TV", "SAT7 Pars", "Mohabat TV",
-            "Didar Global TV", "Persiana One", "Marjan TV", "AFN TV",
-            "Iran TV Network", "Andisheh TV", "IRINN", "iFilm Persian",
-            "Nasim TV", "Quran TV", "Jame-Jam 1",
-        ],
-        "other": [
-            "Al Jazeera English", "BBC News", "Euronews", "France 24",
-            "DW English", "TRT World", "CGTN", "Sky News International",
-            "Love Nature", "Docubox", "Fashion TV", "Trace Urban",
-        ],
-    },
-    "Turksat 42.0E": {
-        "kurdish": [
-            "TRT Kurdi", "Zarok TV", "Jiyan TV",
-        ],
-        "persian": [],
-        "other": [
-            "TRT 1", "TRT 2", "TRT Haber", "TRT Spor", "TRT Cocuk",
-            "TRT Muzik", "TRT Belgesel", "TRT World", "TRT Avaz", "TRT Arabi",
-            "TRT Turk", "Show TV", "Show Turk", "Kanal D", "Star TV", "ATV",
-            "A Haber", "CNN Turk", "NTV", "Haberturk", "24 TV", "TGRT Haber",
-            "TGRT Belgesel", "Beyaz TV", "Kanal 7", "TV8", "TLC", "Teve2",
-            "A Spor", "FOX Turkiye", "Dream Turk", "Number One TV",
-            "Number One Turk", "PowerTurk TV", "Kral TV", "Kral Pop TV",
-            "Minika GO", "Minika Cocuk", "Haber Global", "Show Max",
-            "Duck TV", "TRT EBA", "TMB TV",
-        ],
-    },
-}
-
-# Flatten rosters -> {normalized_name: (hint, satellite)}
-ROSTER = {}
-ROSTER_HINT_SCORE = {"kurdish": ("kur", 6), "persian": ("per", 6)}
-
-def _norm(txt):
-    t = txt.lower().strip()
-    t = re.sub(r"[\W_]+", " ", t)
-    return re.sub(r"\s+", " ", t).strip()
-
-for _sat, _groups in SATELLITES.items():
-    for _hint, _names in _groups.items():
-        for _n in _names:
-            ROSTER.setdefault(_norm(_n), (_hint, _sat))
-
-# Names that must NEVER match the roster (known collisions)
-ROSTER_BLACKLIST = {
-    "anadolu net tv",   # Turkish channel, not the Kurdish "Net TV"
-    "atn bangla", "atn bangla uk", "atn news bangla",  # Bangladeshi ATN
-    "azan tv",          # not Afghan "Zan TV"
-}
-
-# =============================================================
-# PLAYLIST SOURCES
-# =============================================================
-
-SOURCES = [
-    # MASTER (matched against satellite rosters)
-    "https://iptv-org.github.io/iptv/index.m3u",
-    # LANGUAGES
-    "https://iptv-org.github.io/iptv/languages/fas.m3u",
-    "https://iptv-org.github.io/iptv/languages/kur.m3u",
-    "https://iptv-org.github.io/iptv/languages/ara.m3u",
-    # COUNTRIES
-    "https://iptv-org.github.io/iptv/countries/ir.m3u",
-    "https://iptv-org.github.io/iptv/countries/iq.m3u",
-    "https://iptv-org.github.io/iptv/countries/tr.m3u",
-    "https://iptv-org.github.io/iptv/countries/af.m3u",
-    "https://iptv-org.github.io/iptv/countries/sy.m3u",
-    # CATEGORIES
-    "https://iptv-org.github.io/iptv/categories/movies.m3u",
-    "https://iptv-org.github.io/iptv/categories/entertainment.m3u",
-    "https://iptv-org.github.io/iptv/categories/news.m3u",
-    "https://iptv-org.github.io/iptv/categories/kids.m3u",
-    "https://iptv-org.github.io/iptv/categories/music.m3u",
-    "https://iptv-org.github.io/iptv/categories/documentary.m3u",
-    # FREE PUBLIC PLAYLISTS
-    "https://raw.githubusercontent.com/Free-TV/IPTV/master/playlist.m3u8",
-]
-
-# iptv-org channel database (id -> categories/country) for tvg-id matching
-DB_URL = "https://raw.githubusercontent.com/iptv-org/database/master/data/channels.csv"
-
-# Kurdish live TV portal â€” stream URLs scraped per channel page
-KURDTVS = {
-    "Kurdistan 24": "kurdistan24-tv", "Rudaw": "rudaw-tv-hd",
-    "Kurdsat": "kurdsat-tv", "Kurdsat News": "kurdsat-news",
-    "NRT": "nrt-tv-hd", "NRT2": "nrt2", "NRT4": "nrt-4",
-    "Kurdmax Sorani": "kurdmax", "Kurdmax Kurmanci": "kurdmax-kurmanci",
-    "Kurdmax Show": "kurdmax-show", "Kurdmax Show Kurmanci": "kurdmax-show-kurmanci",
-    "Kurdmax Music": "kurdmax-music", "Kurdistan TV": "kurdistan-tv",
-    "Zagros TV": "zagros-tv", "Gali Kurdistan": "gali-kurdistan-tv",
-    "Net TV": "net-tv", "Newline HD": "newline-hd-tv", "Ava TV": "ava-tv",
-    "Waar TV": "waar-tv", "Khak TV": "khak-tv", "Kirkuk TV": "kirkuk-tv",
-    "Speda TV": "speda-tv", "Payam TV": "payam-tv", "Sterk TV": "sterk-tv",
-    "Ronahi TV": "ronahi-tv", "Rasan TV": "rasan-tv", "Afarin TV": "afarin-tv",
-    "Amozhgary TV": "amozhgary-tv", "Duhok TV": "duhok-tv",
-    "UTV Hawler": "utv-hawler", "Cihan TV": "cihan-tv-hd", "KNN TV": "knn-channel",
-    "Folklor TV": "folklor-tv", "TRT Kurdi": "trt-kurdi-tv",
-    "Zarok TV": "zarok-tv-kurdmanci",
-}
-KURDTVS_BASE = "https://kurdtvs.net/"
-
-# Manually verified seeds for important channels not found via sources
-SEED_CHANNELS = [
-    {"name": "Kurdistan 24", "url": "https://d1x82nydcxndze.cloudfront.net/live/index.m3u8",
-     "attrs": {"tvg-language": "Kurdish"}, "source": "seed"},
-]
-
-# =============================================================
-# KEYWORDS (match on word boundaries, case-insensitive)
-# =============================================================
-
-KURDISH_KW = [
-    "kurd", "kurdi", "kurdistan", "kurmanci", "sorani", "rudaw", "kurdsat",
-    "kurdmax", "zagros", "sterk", "ronahi", "zarok", "speda", "jiyan",
-    "welat", "rojava", "badinan", "newroz", "medya", "mezopotamya", "duhok",
-    "hewler", "erbil", "sulaymaniyah", "amed", "kirkuk", "kerkuk", "nalia",
-    "waar", "khak", "komala", "aso tv", "tishk", "gali kurdistan", "cira",
-    "med muzik", "mmc", "nrt", "k24", "trt kurdi", "folklor",
-    "payam tv", "afarin", "rasan", "judi", "ezidxan", "avroeira", "4 kurd",
-]
-
-PERSIAN_KW = [
-    "persian", "farsi", "pars", "parsi", "iran", "irib", "irinn", "jame-jam",
-    "jam-e-jam", "manoto", "ifilm", "varzesh", "mostanad", "pooya", "nahal",
-    "tamasha", "nasim", "ofogh", "amouzesh", "salamat", "shoma", "tehran",
-    "persiana", "tapesh", "pmc", "radio javan", "mihan", "sat7", "sat 7 pars",
-    "mohabat", "kalameh", "nejat", "hodhod", "hod hod", "tolo", "tolonews",
-    "ariana", "shamshad", "khurshid", "lemar", "1tv", "hewad", "mitra",
-    "zan tv", "tamadon", "batur", "arezo", "watan tv", "negah", "iman tv",
-    "noorin", "bbc persian", "voa persian", "iran international", "simaye azadi",
-    "andisheh", "omid-e-iran", "nour tv", "azadi", "hambastegi", "marjaeyat",
-    "ayeneh", "vivana", "shabakeh", "itn", "marjan", "afn", "didar",
-    "channel one", "apadana", "gem", "press tv", "hispan tv", "al-alam",
-    "al-kawthar", "sahar", "afghanistan international", "navahang",
-    "ava family", "ava series", "sharq tv", "dunya naw", "tv farah",
-    "payam aramesh", "24box", "your time tv", "saamen", "oxir",
-    "play plus tv", "20tv", "xo tv", "marjan tv", "dunya naw",
-]
-
-MOVIE_KW = [
-    "movie", "movies", "film", "cinema", "cine", "series", "serial", "vod",
-    "drama", "ifilm", "fox movies", "star movies", "sony movies", "amc",
-    "rotana cinema", "mbc 2", "mbc action", "mbc drama", "cairo cinema",
-    "cairo drama", "waar cinema", "classic movies", "paramount", "mbc bollywood",
-    "gem film", "gem drama", "gem series", "gem classic", "aflam",
-]
-
-MUSIC_KW = [
-    "music", "muzik", "mtv", "vh1", "radio javan", "pmc", "tapesh", "kral",
-    "powerturk", "dream turk", "number one", "nrj", "trace", "clubbing tv",
-    "med muzik", "jiyan", "folklor", "stereo", "rotana music", "mazzika",
-    "free tv", "hit music", "gem music", "tmb tv",
-]
-
-NEWS_KW = [
-    "news", "khabar", "haber", "press", "al jazeera", "aljazeera", "al arabiya",
-    "al hadath", "bbc", "cnn", "euronews", "france 24", "france24", "dw ",
-    "sky news", "rt ", "tolonews", "irinn", "cnbc", "abc news", "fox news",
-    "al ekhbariya", "cgtn", "trt world", "trt haber", "alalam",
-]
-
-KIDS_KW = [
-    "kids", "kidz", "children", "cocuk", "cartoon", "animation", "baby",
-    "junior", "nickelodeon", "nick jr", "disney", "boomerang", "cartoonito",
-    "cartoon network", "duck tv", "baby tv", "babyfirst", "pooya", "nahal",
-    "hodhod", "zarok", "minika", "trt cocuk", "pepule", "gem junior", "majid",
-    "baraem", "jeem", "spacetoon", "mbc 3", "yaslyk", "toyor", "rotana kids",
-    "aso kids", "anime",
-]
-
-DOC_KW = [
-    "documentary", "document", "belgesel", "mostanad", "wildlife", "wild",
-    "nature", "animal planet", "national geographic", "nat geo", "discovery",
-    "history", "da vinci", "planet", "explorer", "love nature", "smithsonian",
-    "docubox", "trt belgesel", "tgrt belgesel", "al jazeera documentary",
-    "travel xp",
-]
-
-DB_CAT_MAP = {
-    "movies": "movie", "series": "movie", "classic": "movie",
-    "music": "music",
-    "news": "news", "business": "news",
-    "kids": "kids", "animation": "kids", "family": "kids",
-    "documentary": "doc", "science": "doc", "culture": "doc", "travel": "doc",
-}
-
-def _mk_regex(words):
-    esc = [re.escape(w) for w in sorted(words, key=len, reverse=True)]
-    return re.compile(r"(?:\b" + r"\b|\b".join(esc) + r"\b)", re.IGNORECASE)
-
-RE_KUR  = _mk_regex(KURDISH_KW)
-RE_PER  = _mk_regex(PERSIAN_KW)
-RE_MOV  = _mk_regex(MOVIE_KW)
-RE_MUS  = _mk_regex(MUSIC_KW)
-RE_NEWS = _mk_regex(NEWS_KW)
-RE_KID  = _mk_regex(KIDS_KW)
-RE_DOC  = _mk_regex(DOC_KW)
-
-# =============================================================
-# HELPERS
-# =============================================================
-
-def download(url, binary=False):
-    try:
-        r = requests.get(url, headers=HEADERS, timeout=40)
-        r.raise_for_status()
-        return r.content if binary else r.text
-    except Exception as e:
-        print("DOWNLOAD ERROR:", url, e)
-        return b"" if binary else ""
-
-
-def parse_m3u(content, source):
-    """Return list of dicts: name, attrs, url, source"""
-    lines = content.splitlines()
-    channels = []
-    for i, raw in enumerate(lines):
-        line = raw.strip()
-        if line.startswith("#EXTINF"):
-            attrs = dict(re.findall(r'([\w-]+)="([^"]*)"', line))
-            name = line.rsplit(",", 1)[-1].strip()
-            if i + 1 < len(lines):
-                url = lines[i + 1].strip()
-                if url.startswith("http"):
-                    channels.append({
-                        "name": name, "attrs": attrs,
-                        "url": url, "source": source,
-                    })
-    return channels
-
-
-def load_db():
-    """iptv-org database: id -> {'cats': set, 'country': str}"""
-    db = {}
-    text = download(DB_URL)
-    if not text:
-        return db
-    reader = csv.DictReader(io.StringIO(text))
-    for row in reader:
-        cats = set((row.get("categories") or "").split(";"))
-        db[row["id"]] = {"cats": cats, "country": row.get("country", "")}
-    print("DB entries:", len(db))
-    return db
-
-
-def scrape_kurdtvs():
-    """Fetch live stream URLs of Kurdish channels from kurdtvs.net"""
-    out = []
-    for name, slug in KURDTVS.items():
-        try:
-            html = requests.get(KURDTVS_BASE + slug, headers=HEADERS, timeout=20).text
-            m = re.search(r"stream(?:Url)?s\s*=\s*(\[.*?\])\s*;", html, re.DOTALL)
-            if not m:
-                continue
-            for s in json.loads(m.group(1)):
-                u = s.get("url", "")
-                if u.startswith("http") and ".m3u8" in u:
-                    out.append({
-                        "name": name, "url": u,
-                        "attrs": {"tvg-language": "Kurdish"},
-                        "source": "kurdtvs.net",
-                    })
-                    break
-        except Exception as e:
-            print("KURDTVS ERROR:", slug, e)
-    print("KURDTVS streams:", len(out))
-    return out
-
-
-def normalize_url(url):
-    return url.split("?")[0].lower().strip()
-
-
-def clean_name(name):
-    n = re.sub(r"\s{2,}", " ", name).strip()
-    n = re.sub(r"\s*\[(geo.?blocked|not 24/7)\]", "", n, flags=re.IGNORECASE)
-    return n.strip(" -")
-
-
-def dedupe_key(name):
-    n = _norm(name)
-    n = re.sub(r"\b(\d{3,4}p|u?hd|fhd|sd|hq|4k|hevc)\b", "", n)
-    return re.sub(r"\s{2,}", " ", n).strip()
-
-# =============================================================
-# CLASSIFICATION â€” every channel gets exactly ONE group
-# =============================================================
-
-def classify(ch, db):
-    """Return (group, satellites_set). is_target decided by caller:
-    channel is kept if group != 'DROP' and (matched language/genre/roster)."""
-    name = ch["name"]
-    attrs = ch["attrs"]
-    blob = " {} ".format(_norm(" ".join([
-        name, attrs.get("group-title", ""), attrs.get("tvg-name", ""),
-        ch["url"].split("/")[2] if ch["url"].startswith("http") else "",
-    ])))
-
-    scores = {"kur": 0, "per": 0, "movie": 0, "music": 0,
-              "news": 0, "kids": 0, "doc": 0}
-    sats = set()
-
-    # 1. tvg-language (strong)
-    lang = attrs.get("tvg-language", "").lower()
-    if lang.startswith(("kurd", "central kurd")):
-        scores["kur"] += 6
-    if lang.startswith(("persian", "farsi", "dari", "tajik")):
-        scores["per"] += 6
-
-    # 2. satellite roster (strong) â€” exact, then safe prefix matching
-    key = dedupe_key(name)
-    hit = None if key in ROSTER_BLACKLIST else ROSTER.get(key)
-    if hit is None and key not in ROSTER_BLACKLIST:
-        for rn, (hint, sat) in ROSTER.items():
-            # "Kurdsat News" starts with roster "kurdsat" âœ“
-            # but "Lao Net TV" must NOT match roster "net tv" âœ—
-            if len(rn) >= 4 and key.startswith(rn):
-                hit = (hint, sat)
-                break
-            # "channel 8" found inside longer roster "channel 8 kurdish"
-            if len(key) >= 5 and rn.startswith(key):
-                hit = (hint, sat)
-                break
-    if hit:
-        hint, sat = hit
-        sats.add(sat)
-        if hint in ROSTER_HINT_SCORE:
-            k, v = ROSTER_HINT_SCORE[hint]
-            scores[k] += v
-        else:
-            scores["movie"] += 1  # known but language-neutral -> keepable
-
-    # 3. tvg-id -> iptv-org database
-    tvg_id = attrs.get("tvg-id", "")
-    entry = db.get(tvg_id) or db.get(tvg_id.split("@")[0])
-    if entry:
-        for c in entry["cats"]:
-            mapped = DB_CAT_MAP.get(c)
-            if mapped:
-                scores[mapped] += 4
-
-    # 4. keywords
-    if RE_KUR.search(blob):  scores["kur"]   += 4
-    if RE_PER.search(blob):  scores["per"]   += 4
-    if RE_MOV.search(blob):  scores["movie"] += 3
-    if RE_MUS.search(blob):  scores["music"] += 3
-    if RE_NEWS.search(blob): scores["news"]  += 3
-    if RE_KID.search(blob):  scores["kids"]  += 3
-    if RE_DOC.search(blob):  scores["doc"]   += 3
-
-    # ---- decide group (no overlap) ----
-    if LANGUAGE_FIRST:
-        if scores["kur"] > 0 and scores["kur"] >= scores["per"]:
-            return "Kurdish", sats
-        if scores["per"] > 0:
-            return "Persian", sats
-
-    genres = {"Movies": scores["movie"], "Music": scores["music"],
-              "News": scores["news"], "Kids": scores["kids"],
-              "Documentary": scores["doc"]}
-    best = max(genres, key=lambda g: (genres[g], -GROUP_ORDER.index(g)))
-    if genres[best] > 0:
-        if not LANGUAGE_FIRST and scores["kur"] >= scores["per"] and scores["kur"] > 0:
-            return "Kurdish", sats
-        if not LANGUAGE_FIRST and scores["per"] > 0:
-            return "Persian", sats
-        return best, sats
-
-    # known satellite channel but no genre signal
-    if sats:
-        return "Other", sats
-
-    # themed sources give weak signal via source URL
-    src = ch["source"]
-    for g, slug in [("Movies", "movies"), ("Music", "music"), ("News", "news"),
-                    ("Kids", "kids"), ("Documentary", "documentary")]:
-        if f"/categories/{slug}" in src:
-            return g, sats
-
-    return "DROP", sats
-
-# =============================================================
-# STREAM CHECK
-# =============================================================
-
-VLC_HEADERS = {"User-Agent": "VLC/3.0.20 LibVLC/3.0.20"}
-TRUSTED_SOURCES = ("kurdtvs.net",)  # portal-curated links: kept even if probe fails
-
-async def _probe(session, sem, url, headers):
-    """True = alive | False = clearly dead | None = blocked (geo/DC)"""
-    try:
-        async with sem:
-            async with session.get(url, headers=headers,
-                                   timeout=aiohttp.ClientTimeout(total=CHECK_TIMEOUT),
-                                   allow_redirects=True) as r:
-                ct = r.headers.get("Content-Type", "").lower()
-                if r.status == 200 and (
-                    "video" in ct or "mpegurl" in ct or "octet-stream" in ct
-                    or ".m3u8" in url
-                ):
-                    await r.content.read(64)  # confirm real data flows
-                    return True
-                if r.status in (401, 402, 403):
-                    return None  # blocked for datacenter IPs, OK for end users
-    except Exception:
-        pass
-    return False
-
-
-async def check_stream(session, session_vlc, sem, url, trust=False):
-    if SKIP_CHECK or trust:
-        return True
-    ok = await _probe(session, sem, url, HEADERS)
-    if ok is True or ok is None:
-        return True
-    # retry with VLC fingerprint â€” some servers only serve players
-    ok = await _probe(session_vlc, sem, url, VLC_HEADERS)
-    if ok is True or ok is None:
-        return True
-    return False
-
-
-def load_cache():
-    try:
-        with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        now = datetime.utcnow().timestamp()
-        return {u: v for u, (v, t) in data.items() if now - t < 48 * 3600}
-    except Exception:
-        return {}
-
-
-def save_cache(cache):
-    try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump({u: (v, datetime.utcnow().timestamp()) for u, v in cache.items()}, f)
-    except Exception as e:
-        print("CACHE SAVE ERROR:", e)
-
-# =============================================================
-# BUILD
-# =============================================================
-
-async def build_playlist():
-    db = await asyncio.to_thread(load_db)
-
-    raw = []
-    for source in SOURCES:
-        print("SOURCE:", source)
-        content = await asyncio.to_thread(download, source)
-        if not content:
-            continue
-        parsed = parse_m3u(content, source)
-        print("  parsed:", len(parsed))
-        raw.extend(parsed)
-
-    raw.extend(await asyncio.to_thread(scrape_kurdtvs))
-    raw.extend(dict(c) for c in SEED_CHANNELS)
-    print("RAW TOTAL:", len(raw))
-
-    # dedupe by URL only â€” name-dedupe happens AFTER the health check,
-    # so a live stream is never dropped in favour of a dead duplicate
-    seen_urls, unique = set(), []
-    for ch in raw:
-        u = normalize_url(ch["url"])
-        if u in seen_urls:
-            continue
-        seen_urls.add(u)
-        ch["name"] = clean_name(ch["name"])
-        unique.append(ch)
-    print("DEDUPED:", len(unique))
-
-    # classify
-    kept = []
-    for ch in unique:
-        group, sats = classify(ch, db)
-        if group != "DROP":
-            ch["group"] = group
-            ch["satellites"] = sorted(sats)
-            kept.append(ch)
-    print("KEPT (target):", len(kept))
-
-    # stream check (with cache)
-    cache = load_cache()
-    sem = asyncio.Semaphore(CONCURRENCY)
-    conn = aiohttp.TCPConnector(limit=CONCURRENCY)
-    async with aiohttp.ClientSession(connector=conn) as session, \
-               aiohttp.ClientSession(connector=conn) as session_vlc:
-        todo_idx, results = [], {}
-        for i, ch in enumerate(kept):
-            if ch["url"] in cache:
-                results[i] = cache[ch["url"]]
-            else:
-                todo_idx.append(i)
-        if IPTV_LIMIT > 0:
-            todo_idx = todo_idx[:IPTV_LIMIT]
-            for i in set(range(len(kept))) - set(results) - set(todo_idx):
-                results[i] = True  # trust the rest in test mode
-        if SKIP_CHECK:
-            results = {i: True for i in range(len(kept))}
-            todo_idx = []
-        print("CHECKING:", len(todo_idx), "streams (cached:", len(results), ")")
-        tasks = {
-            i: asyncio.create_task(check_stream(
-                session, session_vlc, sem, kept[i]["url"],
-                trust=kept[i]["source"] in TRUSTED_SOURCES))
-            for i in todo_idx
-        }
-        done = 0
-        for i, t in tasks.items():
-            ok = await t
-            results[i] = ok
-            cache[kept[i]["url"]] = ok
-            done += 1
-            if done % 200 == 0:
-                print(f"  checked {done}/{len(tasks)}")
-    save_cache(cache)
-
-    alive = [ch for i, ch in enumerate(kept) if results.get(i)]
-    print("ALIVE:", len(alive))
-
-    # name-dedupe among alive channels, preferring curated sources & higher res
-    def res_of(name):
-        m = re.search(r"(\d{3,4})p", name)
-        return int(m.group(1)) if m else 0
-
-    src_prio = {"seed": 0, "kurdtvs.net": 1}
-    best = {}
-    for ch in alive:
-        k = dedupe_key(ch["name"]) or dedupe_key(ch["url"])
-        score = (src_prio.get(ch["source"], 2), -res_of(ch["name"]), len(ch["name"]))
-        if k not in best or score < best[k][0]:
-            best[k] = (score, ch)
-    final = [v[1] for v in best.values()]
-    print("AFTER NAME-DEDUPE:", len(final))
-
-    order = {g: n for n, g in enumerate(GROUP_ORDER)}
-    final.sort(key=lambda c: (order[c["group"]], dedupe_key(c["name"])))
-    return final
-
-# =============================================================
-# SAVE
-# =============================================================
-
-def make_extinf(ch):
-    attrs = ch["attrs"]
-    parts = ["#EXTINF:-1"]
-    if attrs.get("tvg-id"):
-        parts.append(f'tvg-id="{attrs["tvg-id"]}"')
-    if attrs.get("tvg-name"):
-        parts.append(f'tvg-name="{attrs["tvg-name"]}"')
-    logo = attrs.get("tvg-logo") or BRAND_LOGO
-    parts.append(f'tvg-logo="{logo}"')
-    if attrs.get("tvg-language"):
-        parts.append(f'tvg-language="{attrs["tvg-language"]}"')
-    parts.append(f'group-title="{ch["group"]}"')
-    return " ".join(parts) + "," + ch["name"]
-
-
-def write_playlist(channels):
-    header = (
-        "#EXTM3U\n"
-        "# +======================================+\n"
-        "#   Anon TV â€” by Aram Moostafaye\n"
-        "#   Kurdish & Persian focused IPTV list\n"
-        "#   https://github.com/arammoostafaye/Iptv\n"
-        "#   Updated: {ts} UTC\n"
-        "# +======================================+\n"
-    ).format(ts=datetime.utcnow().strftime("%Y-%m-%d %H:%M"))
-
-    content = header + "\n".join(
-        f"{make_extinf(ch)}\n{ch['url']}" for ch in channels
-    ) + "\n"
-
-    old_hash = None
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "rb") as f:
-            old_hash = hashlib.md5(f.read()).hexdigest()
-    new_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
-    updated = old_hash != new_hash
-
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(content)
-
-    data = [{
-        "name": ch["name"],
-        "group": ch["group"],
-        "stream": ch["url"],
-        "logo": ch["attrs"].get("tvg-logo") or BRAND_LOGO,
-        "tvg_id": ch["attrs"].get("tvg-id", ""),
-        "satellites": ch["satellites"],
-    } for ch in channels]
-
-    counts = {}
-    for ch in channels:
-        counts[ch["group"]] = counts.get(ch["group"], 0) + 1
-
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump({
-            "updated": datetime.utcnow().isoformat(),
-            "total": len(data),
-            "groups": counts,
-            "channels": data,
-        }, f, indent=2, ensure_ascii=False)
-
-    return updated
-
-# =============================================================
-# TELEGRAM  (settings unchanged)
-# =============================================================
-
-async def send_telegram(channels, updated):
-    if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
-        print("TELEGRAM CONFIG MISSING")
-        return
-
-    status = "UPDATED âœ…" if updated else "NO CHANGE âš ï¸"
-
-    grouped = {g: [] for g in GROUP_ORDER}
-    sat_count = {}
-    for ch in channels:
-        grouped[ch["group"]].append(ch["name"])
-        for s in ch["satellites"]:
-            sat_count[s] = sat_count.get(s, 0) + 1
-
-    message = (
-        f"ðŸ“¡ IPTV UPDATE\n\n"
-        f"Status: {status}\n"
-        f"Total Channels: {len(channels)}\n"
-        f"UTC: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')}\n\n"
-    )
-
-    for group, names in grouped.items():
-        if not names:
-            continue
-        message += f"ðŸ“‚ {group} ({len(names)})\n"
-        for n in sorted(set(names))[:50]:
-            message += f" â€¢ {n}\n"
-        message += "\n"
-
-    if sat_count:
-        message += "ðŸ›° Satellites:\n"
-        for s, c in sorted(sat_count.items(), key=lambda x: -x[1]):
-            message += f" â€¢ {s}: {c}\n"
-
-    if len(message) > 4000:
-        message = message[:4000] + "\n..."
+# aiohttp (~200 ms to import) is imported inside the functions that go on
+# the network, so tools that only parse / classify never load it
 
-    url = f"https://api.telegram.org/bot{TELEGRAM_TOKEN}/sendMessage"
+try:  # optional: without it the split playlists ship with .gz only
+    import brotli
+except ImportError:
+    brotli = None
 
-    try:
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, json={
-                "chat_id": TELEGRAM_CHAT_ID,
-                "text": message
-            }) as r:
-                print("TELEGRAM:", r.status)
-    except Exception as e:
-        print("TELEGRAM ERROR:", e)
+try:  # peak RSS in the run report; not available on Windows
+    import resource
+except ImportError:
+    resource = None
 
 # =============================================================
-# MAIN
+# CONFIG
 # =============================================================
 
-async def main():
-    channels = await build_playlist()
-    updated = write_playlist(channels)
-    await send_telegram(channels, updated)
-
-    print("\n=== SUMMARY ===")
-    print("Total channels:", len(channels))
-    counts = {}
-    for ch in channels:
-        counts[ch["group"]] = counts.get(ch["group"], 0) + 1
-    for g in GROUP_ORDER:
-        if g in counts:
-            print(f"  {g}: {counts[g]}")
-
-
-if __name__ == "__main__":
-    asyncio.run(main())CACHE_FILE  = "check_cache.json"
+OUTPUT_FILE = "list.m3u"
+OUTPUT_JSON = "channels.json"
+OUTPUT_DELTA = "channels_delta.json"  # added/removed/changed vs the previous output
+SPLIT_DIR   = "playlists"             # per-group / per-language playlists + index.json
+API_DIR     = "api"                   # compact paged channels API + index.json
+CACHE_FILE  = "check_cache.json"   # legacy probe cache, migrated into PROBE_DB
+PROBE_DB    = "probe_results.sqlite"
+SOURCE_CACHE_DIR = os.getenv("SOURCE_CACHE_DIR", ".source_cache")  # conditional-GET bodies
+CLASSIFY_CACHE_FILE = "classify_cache.json"
+METRICS_FILE = "run_metrics.json"  # per-stage timings, with RUN_METRICS / --metrics
 
 TELEGRAM_TOKEN   = os.getenv("TELEGRAM_TOKEN")
 TELEGRAM_CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
@@ -850,10 +73,24 @@ BRAND_LOGO = "https://raw.githubusercontent.com/arammoostafaye/Iptv/main/assets/
 
 # Runtime knobs (all optional)
 CHECK_TIMEOUT = int(os.getenv("CHECK_TIMEOUT", "7"))       # seconds per stream probe
+SOURCE_TIMEOUT = int(os.getenv("SOURCE_TIMEOUT", "40"))    # seconds per playlist / DB fetch
 CONCURRENCY   = int(os.getenv("CHECK_CONCURRENCY", "120")) # parallel probes
 IPTV_LIMIT    = int(os.getenv("IPTV_LIMIT", "0"))          # 0 = no limit (testing aid)
+API_PAGE_SIZE = int(os.getenv("API_PAGE_SIZE", "200"))     # channels per API page
 SKIP_CHECK    = os.getenv("IPTV_SKIP_CHECK", "0") == "1"   # trust all (testing aid)
+RUN_METRICS   = os.getenv("RUN_METRICS", "0") == "1"       # write METRICS_FILE + table
 INCLUDE_ADULT = False                                      # 18+ content is filtered out
+HOST_CONCURRENCY = int(os.getenv("CHECK_HOST_CONCURRENCY", "8"))  # parallel probes per host
+# head-then-get reads no body, so a stream that sends headers and then stalls
+# passes it; with CHECK_DEEP_HLS an inconclusive .m3u8 is confirmed by a GET
+PROBE_MODE    = os.getenv("CHECK_PROBE_MODE", "get")       # get | head-then-get | range
+CHECK_DEADLINE = float(os.getenv("CHECK_DEADLINE", "0"))   # seconds for the check phase, 0 = none
+DEEP_HLS      = os.getenv("CHECK_DEEP_HLS", "0") == "1"    # follow HLS down to a segment
+DEEP_CONCURRENCY = int(os.getenv("CHECK_DEEP_CONCURRENCY", "20"))  # deep checks at once
+DEEP_TIME_BUDGET = float(os.getenv("CHECK_DEEP_TIME", "12"))       # seconds per URL
+DEEP_BYTE_BUDGET = int(os.getenv("CHECK_DEEP_BYTES", "524288"))    # bytes per URL
+CLASSIFY_WORKERS = int(os.getenv("CLASSIFY_WORKERS", str(os.cpu_count() or 1)))  # 1 = serial
+CLASSIFY_PARALLEL_MIN = int(os.getenv("CLASSIFY_PARALLEL_MIN", "20000"))  # uncached channels
 
 # Rule: language folders win over genre folders (removes overlap).
 # e.g. iFilm -> Persian (not Movies), Rudaw -> Kurdish (not News).
@@ -982,7 +219,8 @@ SATELLITES = {
     },
 }
 
-# Flatten rosters -> {normalized_name: (hint, satellite)}
+# Flatten rosters -> {normalized_name: (hint, satellite)}; filled in by
+# _load_rules() on the first classify(), with ROSTER_TRIE and KEYWORD_INDEX
 ROSTER = {}
 ROSTER_HINT_SCORE = {"kurdish": ("kur", 6), "persian": ("per", 6)}
 
@@ -991,10 +229,46 @@ def _norm(txt):
     t = re.sub(r"[\W_]+", " ", t)
     return re.sub(r"\s+", " ", t).strip()
 
-for _sat, _groups in SATELLITES.items():
-    for _hint, _names in _groups.items():
-        for _n in _names:
-            ROSTER.setdefault(_norm(_n), (_hint, _sat))
+def _build_roster_trie(names):
+    """Character trie over roster names. node = [children, index of the name
+    ending here, smallest index of any name in this subtree]"""
+    root = [{}, None, None]
+    for idx, rn in enumerate(names):
+        node = root
+        for c in rn:
+            if node[2] is None:
+                node[2] = idx  # indices only grow, so the first one is the min
+            node = node[0].setdefault(c, [{}, None, None])
+        if node[2] is None:
+            node[2] = idx
+        if node[1] is None:
+            node[1] = idx
+    return root
+
+ROSTER_NAMES = []
+ROSTER_TRIE = None
+
+def roster_prefix_hit(key):
+    """Roster entry for the first name (in ROSTER order) that is a prefix of
+    key (len >= 4) or that key is a prefix of (len(key) >= 5); None if none.
+    One walk down the trie instead of a scan over the whole roster."""
+    if ROSTER_TRIE is None:
+        _load_rules()
+    best = None
+    node = ROSTER_TRIE
+    for depth, c in enumerate(key, 1):
+        node = node[0].get(c)
+        if node is None:
+            break
+        # "Kurdsat News" starts with roster "kurdsat" ✓
+        # but "Lao Net TV" must NOT match roster "net tv" ✗
+        if depth >= 4 and node[1] is not None and (best is None or node[1] < best):
+            best = node[1]
+    else:
+        # "channel 8" found inside longer roster "channel 8 kurdish"
+        if len(key) >= 5 and (best is None or node[2] < best):
+            best = node[2]
+    return None if best is None else ROSTER[ROSTER_NAMES[best]]
 
 # Names that must NEVER match the roster (known collisions)
 ROSTER_BLACKLIST = {
@@ -1141,56 +415,411 @@ DB_CAT_MAP = {
     "documentary": "doc", "science": "doc", "culture": "doc", "travel": "doc",
 }
 
-def _mk_regex(words):
-    esc = [re.escape(w) for w in sorted(words, key=len, reverse=True)]
-    return re.compile(r"(?:\b" + r"\b|\b".join(esc) + r"\b)", re.IGNORECASE)
+# (score key, keyword list) — scanned together in one pass over the blob
+KEYWORD_TABLES = [
+    ("adult", ADULT_KW), ("kur", KURDISH_KW), ("per", PERSIAN_KW),
+    ("movie", MOVIE_KW), ("music", MUSIC_KW), ("news", NEWS_KW),
+    ("kids", KIDS_KW), ("doc", DOC_KW),
+]
+KEYWORD_SCORE = {"kur": 4, "per": 4, "movie": 3, "music": 3,
+                 "news": 3, "kids": 3, "doc": 3}
+
+# characters re.IGNORECASE folds onto ASCII letters that str.lower() keeps
+_KW_FOLD = {0x131: "i", 0x17f: "s"}
+
+def _compile_keywords(tables):
+    """first token -> [(following tokens, needs a word after, category)]
+
+    The blob is _norm()ed, i.e. single-space separated word tokens, so a
+    \\b-bounded keyword match is a run of whole tokens. A trailing space
+    ("dw ") means another word must follow. Keywords with other punctuation
+    ("jame-jam", "18+") can never appear in a normalized blob and are left out.
+    """
+    index = {}
+    for cat, words in tables:
+        for w in words:
+            w = w.lower()
+            core = w[:-1] if w.endswith(" ") else w
+            if not core or _norm(core) != core:
+                continue
+            toks = core.split(" ")
+            index.setdefault(toks[0], []).append((tuple(toks[1:]), core != w, cat))
+    return index
+
+KEYWORD_INDEX = None
+
+
+def _load_rules():
+    """Build ROSTER, ROSTER_TRIE and KEYWORD_INDEX from the tables above.
+    Deferred to first use: importing the module (tools, benchmarks, pool
+    workers) should not pay for rules it may never run."""
+    global ROSTER_NAMES, ROSTER_TRIE, KEYWORD_INDEX
+    for sat, groups in SATELLITES.items():
+        for hint, names in groups.items():
+            for n in names:
+                ROSTER.setdefault(_norm(n), (hint, sat))
+    ROSTER_NAMES = list(ROSTER)
+    KEYWORD_INDEX = _compile_keywords(KEYWORD_TABLES)
+    ROSTER_TRIE = _build_roster_trie(ROSTER_NAMES)  # last: it marks "loaded"
+
+
+def scan_keywords(blob):
+    """Set of KEYWORD_TABLES categories with at least one keyword in blob"""
+    if KEYWORD_INDEX is None:
+        _load_rules()
+    toks = blob.translate(_KW_FOLD).split()
+    n = len(toks)
+    found = set()
+    for i, t in enumerate(toks):
+        for rest, follow, cat in KEYWORD_INDEX.get(t, ()):
+            if cat in found:
+                continue
+            end = i + 1 + len(rest)
+            if follow and end >= n:
+                continue
+            if not rest or tuple(toks[i + 1:end]) == rest:
+                found.add(cat)
+    return found
+
+# =============================================================
+# RUN METRICS — wall / CPU time, item counts and peak RSS per stage
+# =============================================================
+
+STAGES = []  # one record per stage, in start order
+
+
+def _cpu_seconds():
+    # children too: classification runs in a process pool
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+def _peak_rss_mb():
+    if resource is None:
+        return None
+    kb = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,     # KiB on Linux
+             resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return round(kb / 1024, 1)
+
+
+def stage_begin(name):
+    rec = {"stage": name, "items": None,
+           "_wall": time.perf_counter(), "_cpu": _cpu_seconds()}
+    STAGES.append(rec)
+    return rec
+
 
-RE_KUR  = _mk_regex(KURDISH_KW)
-RE_PER  = _mk_regex(PERSIAN_KW)
-RE_MOV  = _mk_regex(MOVIE_KW)
-RE_MUS  = _mk_regex(MUSIC_KW)
-RE_NEWS = _mk_regex(NEWS_KW)
-RE_KID  = _mk_regex(KIDS_KW)
-RE_DOC  = _mk_regex(DOC_KW)
-RE_ADULT = _mk_regex(ADULT_KW)
+def stage_end(rec, items=None):
+    rec["wall_s"] = round(time.perf_counter() - rec.pop("_wall"), 3)
+    rec["cpu_s"] = round(_cpu_seconds() - rec.pop("_cpu"), 3)
+    rec["peak_rss_mb"] = _peak_rss_mb()
+    if items is not None:
+        rec["items"] = items
+
+
+async def timed(name, coro, count=len):
+    """Await coro as its own stage. Stages awaited side by side overlap,
+    so their CPU times are shared, not additive."""
+    rec = stage_begin(name)
+    try:
+        result = await coro
+    finally:
+        stage_end(rec)
+    if result is not None:
+        rec["items"] = count(result)
+    return result
+
+
+def write_metrics(started):
+    """METRICS_FILE with every stage plus the run's counters, and the
+    summary table"""
+    stages = [s for s in STAGES if "wall_s" in s]  # an aborted stage has no end
+    report = {
+        "started": started.isoformat(),
+        "wall_s": round(sum(s["wall_s"] for s in stages if "/" not in s["stage"]), 3),
+        "peak_rss_mb": _peak_rss_mb(),
+        "stages": stages,
+        "counters": {
+            "sources": {state: sum(1 for v in SOURCE_STATS.values() if v == state)
+                        for state in sorted(set(SOURCE_STATS.values()))},
+            "probes": PROBE_STATS,
+            "check": CHECK_STATS,
+            "deep_hls": DEEP_STATS,
+        },
+    }
+    with open(METRICS_FILE, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print(f"\n{'stage':<18}{'wall s':>9}{'cpu s':>9}{'items':>8}{'rss MB':>9}")
+    for s in stages:
+        items = "" if s["items"] is None else s["items"]
+        rss = "" if s["peak_rss_mb"] is None else s["peak_rss_mb"]
+        print(f"{s['stage']:<18}{s['wall_s']:>9.2f}{s['cpu_s']:>9.2f}{items:>8}{rss:>9}")
+    print("METRICS:", METRICS_FILE)
 
 # =============================================================
 # HELPERS
 # =============================================================
 
-def download(url, binary=False):
+# url -> "hit" (304) | "miss" (200) | "stale" (error, cached copy) | "error"
+SOURCE_STATS = {}
+CHUNK_SIZE = 64 * 1024
+
+
+def _source_cache_paths(url):
+    key = hashlib.sha1(url.encode("utf-8")).hexdigest()
+    base = os.path.join(SOURCE_CACHE_DIR, key)
+    return base + ".json", base + ".body"
+
+
+def _source_cache_meta(url):
+    """Validators of the stored copy, or {} when there is no usable copy"""
+    meta_path, body_path = _source_cache_paths(url)
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        return meta if os.path.exists(body_path) else {}
+    except Exception:
+        return {}
+
+
+def _source_cache_chunks(url):
+    _, body_path = _source_cache_paths(url)
+    with open(body_path, "rb") as f:
+        while True:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+
+def _source_cache_commit(url, tmp_path, headers):
+    meta_path, body_path = _source_cache_paths(url)
+    meta = {
+        "url": url,
+        "etag": headers.get("ETag"),
+        "last_modified": headers.get("Last-Modified"),
+        "fetched": datetime.utcnow().timestamp(),
+    }
     try:
-        r = requests.get(url, headers=HEADERS, timeout=40)
-        r.raise_for_status()
-        return r.content if binary else r.text
+        # body first: a crash in between leaves old validators -> a 200, not a wrong 304
+        os.replace(tmp_path, body_path)
+        with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        os.replace(meta_path + ".tmp", meta_path)
     except Exception as e:
-        print("DOWNLOAD ERROR:", url, e)
-        return b"" if binary else ""
+        print("SOURCE CACHE SAVE ERROR:", url, e)
+
+
+async def iter_source(session, url, timeout=SOURCE_TIMEOUT, cache=True,
+                      partial_ok=False):
+    """Yield the body of url in raw byte chunks as they arrive.
+
+    With cache=True the body is kept in SOURCE_CACHE_DIR with its ETag /
+    Last-Modified, revalidated with a conditional GET, and replayed from disk
+    on 304 or when the upstream fails (stale-if-error). A None chunk means
+    "drop what you got so far": the transfer broke mid-body and, if there is
+    a stored copy, it follows from the start. With partial_ok=True a consumer
+    that stops early (aclose()) still gets the prefix it read stored."""
+    import aiohttp
+    meta = _source_cache_meta(url) if cache else {}
+    headers = dict(HEADERS)
+    if meta.get("etag"):
+        headers["If-None-Match"] = meta["etag"]
+    if meta.get("last_modified"):
+        headers["If-Modified-Since"] = meta["last_modified"]
+
+    tmp_path = _source_cache_paths(url)[1] + ".tmp" if cache else None
+    sent = False
+    try:
+        try:
+            async with session.get(url, headers=headers,
+                                   timeout=aiohttp.ClientTimeout(total=timeout)) as r:
+                if r.status == 304 and meta:
+                    SOURCE_STATS[url] = "hit"
+                    for chunk in _source_cache_chunks(url):
+                        yield chunk
+                    return
+                r.raise_for_status()
+                tmp = None
+                if cache:
+                    os.makedirs(SOURCE_CACHE_DIR, exist_ok=True)
+                    tmp = open(tmp_path, "wb")
+                try:
+                    async for chunk in r.content.iter_chunked(CHUNK_SIZE):
+                        if tmp:
+                            tmp.write(chunk)
+                        sent = True
+                        yield chunk
+                except GeneratorExit:
+                    if tmp and partial_ok:
+                        tmp.close()
+                        _source_cache_commit(url, tmp_path, r.headers)
+                        SOURCE_STATS[url] = "miss"
+                    raise
+                finally:
+                    if tmp:
+                        tmp.close()
+                resp_headers = r.headers
+        except Exception as e:
+            if sent:
+                yield None
+            if meta:
+                print("DOWNLOAD ERROR (using cached copy):", url, e)
+                SOURCE_STATS[url] = "stale"
+                for chunk in _source_cache_chunks(url):
+                    yield chunk
+                return
+            print("DOWNLOAD ERROR:", url, e)
+            if cache:
+                SOURCE_STATS[url] = "error"
+            return
+        if cache:
+            _source_cache_commit(url, tmp_path, resp_headers)
+            SOURCE_STATS[url] = "miss"
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def download(session, url, timeout=SOURCE_TIMEOUT, cache=True):
+    """GET url as text; "" on any error so one bad source never sinks the run"""
+    parts = []
+    async for chunk in iter_source(session, url, timeout, cache):
+        if chunk is None:
+            parts.clear()
+        else:
+            parts.append(chunk)
+    return b"".join(parts).decode("utf-8", errors="replace")
+
+
+_ATTR_RE = re.compile(r'([\w-]+)="([^"]*)"')
+_intern = sys.intern
+
+
+class Channel:
+    """One playlist entry. The #EXTINF attributes every source uses are
+    slots; any other attribute lands in extra (None while there is none).
+    Strings that repeat across thousands of entries (source, group, attr
+    keys, logos, languages, group titles) are interned, so each is stored
+    once. group / satellites are filled in by classification."""
+
+    __slots__ = ("name", "url", "source", "tvg_id", "tvg_name", "tvg_logo",
+                 "tvg_language", "group_title", "extra", "group", "satellites")
+
+    def __init__(self, name, url, source, attrs=()):
+        """attrs: a dict or (key, value) pairs (later pairs win)"""
+        attrs = dict(attrs)
+        self.name = name
+        self.url = url
+        self.source = _intern(source)
+        self.tvg_id = attrs.pop("tvg-id", "")
+        self.tvg_name = attrs.pop("tvg-name", "")
+        self.tvg_logo = _intern(attrs.pop("tvg-logo", ""))
+        self.tvg_language = _intern(attrs.pop("tvg-language", ""))
+        self.group_title = _intern(attrs.pop("group-title", ""))
+        self.extra = {_intern(k): v for k, v in attrs.items()} if attrs else None
+        self.group = None
+        self.satellites = ()
+
+    def __repr__(self):
+        return f"Channel({self.name!r}, {self.url!r}, {self.source!r})"
+
+
+class M3UParser:
+    """Incremental M3U parser.
+
+    feed() takes raw byte chunks (gzip is detected from the magic bytes) or
+    text and returns the channels completed so far as Channel records.
+    #EXTVLCOPT / #KODIPROP / other # lines between #EXTINF and its URL are
+    skipped. Call close() once the body has ended."""
+
+    def __init__(self, source):
+        self.source = source
+        self._head = b""        # bytes held back until gzip can be sniffed
+        self._sniffed = False
+        self._gz = None
+        self._dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self._tail = ""         # last, still incomplete line
+        self._pending = None    # (name, attrs) of an #EXTINF awaiting its URL
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            chunk = self._decode(chunk)
+        return self._consume(self._split(chunk))
+
+    def close(self):
+        return self._consume(self._split(self._decode(b"", final=True), final=True))
+
+    def _split(self, text, final=False):
+        """Complete lines of text; \n, \r\n and a bare \r all end a line, as
+        with str.splitlines(). The unfinished rest waits for the next chunk,
+        and so does a trailing \r, whose \n may start that chunk."""
+        text = self._tail + text
+        cut = len(text) if final else len(text) - text.endswith("\r")
+        lines = text[:cut].replace("\r\n", "\n").replace("\r", "\n").split("\n")
+        self._tail = "" if final else lines.pop() + text[cut:]
+        return lines
+
+    def _decode(self, data, final=False):
+        if not self._sniffed:
+            self._head += data
+            if len(self._head) < 2 and not final:
+                return ""
+            data, self._head = self._head, b""
+            self._sniffed = True
+            if data[:2] == b"\x1f\x8b":
+                self._gz = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        if self._gz is not None:
+            data = self._gz.decompress(data)
+            if final:
+                data += self._gz.flush()
+        return self._dec.decode(data, final)
+
+    def _consume(self, lines):
+        out = []
+        for raw in lines:
+            line = raw.strip()
+            if not line:
+                continue
+            if line.startswith("#EXTINF"):
+                attrs = _ATTR_RE.findall(line)
+                name = line.rsplit(",", 1)[-1].strip()
+                self._pending = (name, attrs)
+            elif line.startswith("#"):
+                continue
+            elif self._pending is not None:
+                name, attrs = self._pending
+                self._pending = None
+                if line.startswith("http"):
+                    out.append(Channel(name, line, self.source, attrs))
+        return out
 
 
 def parse_m3u(content, source):
-    """Return list of dicts: name, attrs, url, source"""
-    lines = content.splitlines()
-    channels = []
-    for i, raw in enumerate(lines):
-        line = raw.strip()
-        if line.startswith("#EXTINF"):
-            attrs = dict(re.findall(r'([\w-]+)="([^"]*)"', line))
-            name = line.rsplit(",", 1)[-1].strip()
-            if i + 1 < len(lines):
-                url = lines[i + 1].strip()
-                if url.startswith("http"):
-                    channels.append({
-                        "name": name, "attrs": attrs,
-                        "url": url, "source": source,
-                    })
-    return channels
-
-
-def load_db():
+    """Return the list of Channel records in content"""
+    parser = M3UParser(source)
+    return parser.feed(content) + parser.close()
+
+
+async def fetch_m3u(session, source):
+    """Download and parse one playlist, parsing each chunk as it arrives"""
+    parser, out = M3UParser(source), []
+    try:
+        async for chunk in iter_source(session, source):
+            if chunk is None:
+                parser, out = M3UParser(source), []
+                continue
+            out.extend(parser.feed(chunk))
+        out.extend(parser.close())
+    except Exception as e:
+        print("PARSE ERROR:", source, e)
+    return out
+
+
+def parse_db(text):
     """iptv-org database: id -> {'cats': set, 'country': str}"""
     db = {}
-    text = download(DB_URL)
     if not text:
         return db
     reader = csv.DictReader(io.StringIO(text))
@@ -1201,30 +830,107 @@ def load_db():
     return db
 
 
-def scrape_kurdtvs():
+KURDTVS_CONCURRENCY = int(os.getenv("KURDTVS_CONCURRENCY", "6"))  # open pages at once
+_KURDTVS_START = re.compile(r"stream(?:Url)?s\s*=\s*\[")
+_KURDTVS_ARRAY = re.compile(r"stream(?:Url)?s\s*=\s*(\[.*?\])\s*;", re.DOTALL)
+
+
+def parse_kurdtvs(name, streams_json):
+    """Every live .m3u8 candidate of a kurdtvs.net channel, in page order"""
+    out = []
+    for s in json.loads(streams_json):
+        u = s.get("url", "")
+        if u.startswith("http") and ".m3u8" in u:
+            out.append(Channel(name, u, "kurdtvs.net", {"tvg-language": "Kurdish"}))
+    return out
+
+
+async def fetch_kurdtvs_streams(session, sem, slug):
+    """JSON text of a page's streams array, read only as far as needed"""
+    dec = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    buf, start = "", -1
+    async with sem:
+        body = iter_source(session, KURDTVS_BASE + slug, timeout=20,
+                           partial_ok=True)
+        try:
+            async for chunk in body:
+                if chunk is None:
+                    dec.reset()
+                    buf, start = "", -1
+                    continue
+                scanned = len(buf)
+                buf += dec.decode(chunk)
+                if start < 0:
+                    m = _KURDTVS_START.search(buf, max(0, scanned - 32))
+                    if not m:
+                        continue
+                    start = m.start()
+                m = _KURDTVS_ARRAY.match(buf, start)
+                if m:
+                    return m.group(1)  # rest of the page is never read
+        finally:
+            await body.aclose()
+    return None
+
+
+async def scrape_kurdtvs(session):
     """Fetch live stream URLs of Kurdish channels from kurdtvs.net"""
+    sem = asyncio.Semaphore(KURDTVS_CONCURRENCY)
+    names = list(KURDTVS)
+    arrays = await asyncio.gather(*(
+        fetch_kurdtvs_streams(session, sem, KURDTVS[n]) for n in names
+    ), return_exceptions=True)
     out = []
-    for name, slug in KURDTVS.items():
+    for name, arr in zip(names, arrays):
+        if arr is None:
+            continue
         try:
-            html = requests.get(KURDTVS_BASE + slug, headers=HEADERS, timeout=20).text
-            m = re.search(r"stream(?:Url)?s\s*=\s*(\[.*?\])\s*;", html, re.DOTALL)
-            if not m:
-                continue
-            for s in json.loads(m.group(1)):
-                u = s.get("url", "")
-                if u.startswith("http") and ".m3u8" in u:
-                    out.append({
-                        "name": name, "url": u,
-                        "attrs": {"tvg-language": "Kurdish"},
-                        "source": "kurdtvs.net",
-                    })
-                    break
+            if isinstance(arr, Exception):
+                raise arr
+            out.extend(parse_kurdtvs(name, arr))
         except Exception as e:
-            print("KURDTVS ERROR:", slug, e)
+            print("KURDTVS ERROR:", KURDTVS[name], e)
     print("KURDTVS streams:", len(out))
     return out
 
 
+async def ingest():
+    """Fetch every source, the iptv-org DB and kurdtvs.net concurrently
+    over one pooled session. Returns (db, raw channels in SOURCES order)."""
+    import aiohttp
+    conn = aiohttp.TCPConnector(limit=len(SOURCES) + len(KURDTVS) + 1)
+    fetch = stage_begin("fetch")
+    async with aiohttp.ClientSession(connector=conn) as session:
+        db_text, kurd, playlists = await asyncio.gather(
+            timed("fetch/db", download(session, DB_URL),
+                  count=lambda text: text.count("\n")),  # CSV rows
+            timed("fetch/kurdtvs", scrape_kurdtvs(session)),
+            timed("fetch/sources", asyncio.gather(
+                *(fetch_m3u(session, source) for source in SOURCES)),
+                count=lambda parsed: sum(len(p) for p in parsed)),
+        )
+    stage_end(fetch)
+
+    st = stage_begin("parse db")
+    db = parse_db(db_text)
+    stage_end(st, len(db))
+    raw = []
+    for source, parsed in zip(SOURCES, playlists):
+        print("SOURCE:", source, f"[{SOURCE_STATS.get(source, '-')}]")
+        if not parsed:
+            continue
+        print("  parsed:", len(parsed))
+        raw.extend(parsed)
+    raw.extend(kurd)
+    fetch["items"] = len(raw)
+
+    tally = {}
+    for state in SOURCE_STATS.values():
+        tally[state] = tally.get(state, 0) + 1
+    print("SOURCE CACHE:", ", ".join(f"{k}={v}" for k, v in sorted(tally.items())))
+    return db, raw
+
+
 def normalize_url(url):
     return url.split("?")[0].lower().strip()
 
@@ -1240,6 +946,13 @@ def dedupe_key(name):
     n = re.sub(r"\b(\d{3,4}p|u?hd|fhd|sd|hq|4k|hevc)\b", "", n)
     return re.sub(r"\s{2,}", " ", n).strip()
 
+
+def channel_id(name, url):
+    """Stable ID: follows the channel's dedupe identity, so it survives URL,
+    logo and group changes (one output channel per dedupe key)"""
+    key = dedupe_key(name) or dedupe_key(url)
+    return hashlib.sha1(key.encode("utf-8")).hexdigest()[:12]
+
 # =============================================================
 # CLASSIFICATION — every channel gets exactly ONE group
 # =============================================================
@@ -1247,14 +960,16 @@ def dedupe_key(name):
 def classify(ch, db):
     """Return (group, satellites_set). is_target decided by caller:
     channel is kept if group != 'DROP' and (matched language/genre/roster)."""
-    name = ch["name"]
-    attrs = ch["attrs"]
+    if ROSTER_TRIE is None:
+        _load_rules()
+    name = ch.name
     blob = " {} ".format(_norm(" ".join([
-        name, attrs.get("group-title", ""), attrs.get("tvg-name", ""),
-        ch["url"].split("/")[2] if ch["url"].startswith("http") else "",
+        name, ch.group_title, ch.tvg_name,
+        ch.url.split("/")[2] if ch.url.startswith("http") else "",
     ])))
 
-    if not INCLUDE_ADULT and RE_ADULT.search(blob):
+    found = scan_keywords(blob)
+    if not INCLUDE_ADULT and "adult" in found:
         return "DROP", set()
 
     scores = {"kur": 0, "per": 0, "movie": 0, "music": 0,
@@ -1262,7 +977,7 @@ def classify(ch, db):
     sats = set()
 
     # 1. tvg-language (strong)
-    lang = attrs.get("tvg-language", "").lower()
+    lang = ch.tvg_language.lower()
     if lang.startswith(("kurd", "central kurd")):
         scores["kur"] += 6
     if lang.startswith(("persian", "farsi", "dari", "tajik")):
@@ -1272,16 +987,7 @@ def classify(ch, db):
     key = dedupe_key(name)
     hit = None if key in ROSTER_BLACKLIST else ROSTER.get(key)
     if hit is None and key not in ROSTER_BLACKLIST:
-        for rn, (hint, sat) in ROSTER.items():
-            # "Kurdsat News" starts with roster "kurdsat" ✓
-            # but "Lao Net TV" must NOT match roster "net tv" ✗
-            if len(rn) >= 4 and key.startswith(rn):
-                hit = (hint, sat)
-                break
-            # "channel 8" found inside longer roster "channel 8 kurdish"
-            if len(key) >= 5 and rn.startswith(key):
-                hit = (hint, sat)
-                break
+        hit = roster_prefix_hit(key)
     if hit:
         hint, sat = hit
         sats.add(sat)
@@ -1292,7 +998,7 @@ def classify(ch, db):
             scores["movie"] += 1  # known but language-neutral -> keepable
 
     # 3. tvg-id -> iptv-org database
-    tvg_id = attrs.get("tvg-id", "")
+    tvg_id = ch.tvg_id
     entry = db.get(tvg_id) or db.get(tvg_id.split("@")[0])
     if entry:
         for c in entry["cats"]:
@@ -1301,13 +1007,9 @@ def classify(ch, db):
                 scores[mapped] += 4
 
     # 4. keywords
-    if RE_KUR.search(blob):  scores["kur"]   += 4
-    if RE_PER.search(blob):  scores["per"]   += 4
-    if RE_MOV.search(blob):  scores["movie"] += 3
-    if RE_MUS.search(blob):  scores["music"] += 3
-    if RE_NEWS.search(blob): scores["news"]  += 3
-    if RE_KID.search(blob):  scores["kids"]  += 3
-    if RE_DOC.search(blob):  scores["doc"]   += 3
+    for cat in found:
+        if cat in KEYWORD_SCORE:
+            scores[cat] += KEYWORD_SCORE[cat]
 
     # ---- decide group (no overlap) ----
     if LANGUAGE_FIRST:
@@ -1332,7 +1034,7 @@ def classify(ch, db):
         return "Other", sats
 
     # themed sources give weak signal via source URL
-    src = ch["source"]
+    src = ch.source
     for g, slug in [("Movies", "movies"), ("Music", "music"), ("News", "news"),
                     ("Kids", "kids"), ("Documentary", "documentary")]:
         if f"/categories/{slug}" in src:
@@ -1340,119 +1042,804 @@ def classify(ch, db):
 
     return "DROP", sats
 
+
+def _rules_version():
+    """Hash of every table and function classify() depends on"""
+    h = hashlib.sha1()
+    h.update(json.dumps([
+        SATELLITES, sorted(ROSTER_BLACKLIST), ROSTER_HINT_SCORE,
+        KEYWORD_TABLES, KEYWORD_SCORE, DB_CAT_MAP, GROUP_ORDER,
+        LANGUAGE_FIRST, INCLUDE_ADULT, sorted(_KW_FOLD.items()),
+    ], sort_keys=True).encode("utf-8"))
+    def add_code(code):
+        h.update(code.co_code)
+        # names too: ch.tvg_name -> ch.group_title compiles to the same co_code
+        h.update(repr(code.co_names).encode("utf-8"))
+        for c in code.co_consts:
+            if hasattr(c, "co_code"):
+                add_code(c)  # nested lambdas: repr() carries an address
+            elif isinstance(c, frozenset):
+                h.update(repr(sorted(c, key=repr)).encode("utf-8"))
+            else:
+                h.update(repr(c).encode("utf-8"))
+    for fn in (classify, roster_prefix_hit, scan_keywords, dedupe_key, _norm,
+               _load_rules, _compile_keywords, _build_roster_trie):
+        add_code(fn.__code__)
+    return h.hexdigest()
+
+RULES_VERSION = _rules_version()
+
+
+def classify_fingerprint(ch, db):
+    """Digest of everything classify() reads from a channel (and its DB row)"""
+    tvg_id = ch.tvg_id
+    entry = db.get(tvg_id) or db.get(tvg_id.split("@")[0])
+    url = ch.url
+    parts = [
+        ch.name, ch.group_title, ch.tvg_name, ch.tvg_language, tvg_id,
+        url.split("/")[2] if url.startswith("http") else "",
+        ch.source, ";".join(sorted(entry["cats"])) if entry else "",
+    ]
+    return hashlib.blake2b("\x1f".join(parts).encode("utf-8"),
+                           digest_size=16).hexdigest()
+
+
+_WORKER_DB = None
+
+def _classify_worker_init(db):
+    global _WORKER_DB
+    _WORKER_DB = db  # shipped once per worker; rule tables build on first classify()
+
+
+def _classify_chunk(chs, db=None):
+    out = []
+    for ch in chs:
+        group, sats = classify(ch, _WORKER_DB if db is None else db)
+        out.append([group, sorted(sats)])
+    return out
+
+
+async def classify_many(chs, db):
+    """[group, sorted satellites] per channel, in input order. Large batches
+    are split across a process pool; the result is the same as serial."""
+    if CLASSIFY_WORKERS < 2 or len(chs) < max(CLASSIFY_PARALLEL_MIN, 1):
+        return _classify_chunk(chs, db)
+    size = -(-len(chs) // (CLASSIFY_WORKERS * 4))
+    chunks = [chs[i:i + size] for i in range(0, len(chs), size)]
+    loop = asyncio.get_running_loop()
+    with ProcessPoolExecutor(CLASSIFY_WORKERS, initializer=_classify_worker_init,
+                             initargs=(db,)) as pool:
+        parts = await asyncio.gather(*(
+            loop.run_in_executor(pool, _classify_chunk, c) for c in chunks
+        ))
+    print(f"CLASSIFY: {len(chs)} channels on {CLASSIFY_WORKERS} workers")
+    return [r for part in parts for r in part]
+
+
+def load_classify_cache():
+    """fingerprint -> [group, satellites]; empty if the rules changed since"""
+    try:
+        with open(CLASSIFY_CACHE_FILE, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("rules") == RULES_VERSION:
+            return data["entries"]
+    except Exception:
+        pass
+    return {}
+
+
+def save_classify_cache(entries):
+    try:
+        with open(CLASSIFY_CACHE_FILE, "w", encoding="utf-8") as f:
+            json.dump({"rules": RULES_VERSION, "entries": entries}, f,
+                      separators=(",", ":"))
+    except Exception as e:
+        print("CLASSIFY CACHE SAVE ERROR:", e)
+
 # =============================================================
 # STREAM CHECK
 # =============================================================
 
 VLC_HEADERS = {"User-Agent": "VLC/3.0.20 LibVLC/3.0.20"}
-TRUSTED_SOURCES = ("kurdtvs.net",)  # portal-curated links: kept even if probe fails
+TRUSTED_SOURCES = ("kurdtvs.net",)  # portal-curated: kept even if every candidate fails
 
-async def _probe(session, sem, url, headers):
-    """True = alive | False = clearly dead | None = blocked (geo/DC)"""
-    try:
-        async with sem:
-            async with session.get(url, headers=headers,
-                                   timeout=aiohttp.ClientTimeout(total=CHECK_TIMEOUT),
-                                   allow_redirects=True) as r:
-                ct = r.headers.get("Content-Type", "").lower()
-                if r.status == 200 and (
-                    "video" in ct or "mpegurl" in ct or "octet-stream" in ct
-                    or ".m3u8" in url
-                ):
-                    await r.content.read(64)  # confirm real data flows
-                    return True
-                if r.status in (401, 402, 403):
-                    return None  # blocked for datacenter IPs, OK for end users
-    except Exception:
-        pass
-    return False
+# Per-host probe caps (host or parent domain), on top of HOST_CONCURRENCY.
+# Extra ones via CHECK_HOST_LIMITS="example.com=4,cdn.example.net=2".
+HOST_LIMITS = {"jmp2.uk": 16, "pluto.tv": 8, "persiana.live": 4}
+for _item in filter(None, os.getenv("CHECK_HOST_LIMITS", "").split(",")):
+    _h, _, _n = _item.partition("=")
+    HOST_LIMITS[_h.strip().lower()] = int(_n)
 
+THROTTLE_STATUSES = (429, 503)  # host says "slow down" -> back off, retry
+PROBE_RETRIES = 2               # extra attempts after a throttle response
+BACKOFF_MAX = 30                # seconds
+BREAKER_THRESHOLD = int(os.getenv("CHECK_BREAKER_THRESHOLD", "3"))  # connect failures in a row
+BREAKER_SAMPLE = 10             # while open, every Nth probe still goes out
 
-async def check_stream(session, session_vlc, sem, url, trust=False):
-    if SKIP_CHECK or trust:
-        return True
-    ok = await _probe(session, sem, url, HEADERS)
-    if ok is True or ok is None:
-        return True
-    # retry with VLC fingerprint — some servers only serve players
-    ok = await _probe(session_vlc, sem, url, VLC_HEADERS)
-    if ok is True or ok is None:
+
+def url_host(url):
+    try:
+        return (urlsplit(url).hostname or "").lower()
+    except ValueError:
+        return ""
+
+
+def host_limit(host):
+    parts = host.split(".")
+    for i in range(len(parts)):
+        limit = HOST_LIMITS.get(".".join(parts[i:]))
+        if limit is not None:
+            return max(1, limit)
+    return max(1, HOST_CONCURRENCY)
+
+
+class HostThrottle:
+    """Probe slots for one host. The cap halves on 429/503 (with a pause,
+    honouring Retry-After) or on timeouts, and grows back by one per normal
+    response, up to the configured limit.
+
+    Also a circuit breaker: after BREAKER_THRESHOLD connection-level failures
+    in a row (DNS, refused, TLS) the host counts as down and its probes are
+    skipped, except every BREAKER_SAMPLE-th one; any HTTP answer closes it."""
+
+    def __init__(self, host):
+        self.host = host
+        self.max = host_limit(host)
+        self.limit = self.max
+        self.active = 0
+        self.strikes = 0        # throttle responses in a row
+        self.throttled = 0      # total, for the report
+        self.resume_at = 0.0    # loop time before which nothing is sent
+        self.conn_fails = 0     # connection-level failures in a row
+        self.tripped = False
+        self.ever_tripped = False
+        self.seen = 0           # probes that met an open breaker
+        self.skipped = 0        # URLs not checked because of it
+        self.cond = asyncio.Condition()
+
+    def should_skip(self):
+        if not self.tripped:
+            return False
+        self.seen += 1
+        if self.seen % BREAKER_SAMPLE == 0:
+            return False  # sample: is the host back?
         return True
-    return False
+
+    async def acquire(self):
+        async with self.cond:
+            await self.cond.wait_for(lambda: self.active < self.limit)
+            self.active += 1
+        delay = self.resume_at - asyncio.get_running_loop().time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def release(self, outcome, retry_after=None):
+        """outcome: "ok" (normal answer) | "throttle" | "timeout" |
+        "connect" (no connection at all) | "error" | "skipped" """
+        async with self.cond:
+            self.active -= 1
+            if outcome in ("ok", "throttle"):
+                self.conn_fails, self.tripped = 0, False
+            elif outcome == "connect":
+                self.conn_fails += 1
+                if self.conn_fails >= BREAKER_THRESHOLD:
+                    self.tripped = self.ever_tripped = True
+            if outcome == "throttle":
+                self.strikes += 1
+                self.throttled += 1
+                self.limit = max(1, self.limit // 2)
+                try:
+                    pause = float(retry_after)
+                except (TypeError, ValueError):
+                    pause = 2 ** (self.strikes - 1)
+                self.resume_at = max(self.resume_at, asyncio.get_running_loop().time()
+                                     + min(pause, BACKOFF_MAX))
+            elif outcome == "timeout":
+                self.throttled += 1
+                # dead hosts time out too: keep some parallelism for them
+                self.limit = max(min(2, self.max), self.limit // 2)
+            elif outcome == "ok":
+                self.strikes = 0
+                if self.limit < self.max:
+                    self.limit += 1
+            self.cond.notify_all()
+
+
+class ProbeLimiter:
+    """Global probe cap plus one HostThrottle per host"""
+
+    def __init__(self, concurrency):
+        self.sem = asyncio.Semaphore(concurrency)
+        self.hosts = {}
+        self.no_head = set()    # hosts that answered HEAD with 405/501/400
+        self.no_range = set()   # hosts that answered a Range GET with 416
+        self.deep = asyncio.Semaphore(DEEP_CONCURRENCY)
+
+    def host(self, url):
+        h = url_host(url)
+        t = self.hosts.get(h)
+        if t is None:
+            t = self.hosts[h] = HostThrottle(h)
+        return t
+
+    def report(self):
+        return sorted(((t.host, t.throttled) for t in self.hosts.values()
+                       if t.throttled), key=lambda x: -x[1])
+
+    def tripped(self):
+        """[(host, URLs skipped)] of hosts whose breaker opened this run"""
+        return sorted(((t.host, t.skipped) for t in self.hosts.values()
+                       if t.ever_tripped), key=lambda x: -x[1])
+
+
+# probe kind ("get" | "head" | "range") -> probes / body bytes / seconds
+PROBE_STATS = {}
+# check phase: URLs queued, and those left unchecked by the deadline or an
+# open breaker, by the last known result they fell back to
+CHECK_STATS = {}
+RANGE_HEADER = "bytes=0-1023"
+SAMPLE_BYTES = 65536    # body read from a live non-HLS stream to gauge throughput
+SAMPLE_SECS = 1.5       # ...for at most this long after the first byte
+PLAYLIST_BYTES = 16384  # enough of an HLS playlist to see its variants
+_UNSUPPORTED = object()  # HEAD / Range refused by the host: fall back to GET
+_SKIPPED = object()      # host breaker open: not probed, last known result stands
+
+
+def _probe_stat(kind, nbytes, secs):
+    st = PROBE_STATS.setdefault(kind, {"probes": 0, "bytes": 0, "seconds": 0.0})
+    st["probes"] += 1
+    st["bytes"] += nbytes
+    st["seconds"] += secs
+
+
+async def _sample_body(r, url, ct, info, t0):
+    """Confirm real data flows. With info: note the time to the first body
+    byte, and either the top variant of an HLS master or, for anything else,
+    a short throughput sample (SAMPLE_BYTES within SAMPLE_SECS)."""
+    first = await r.content.read(64)
+    if info is None or not first:
+        return
+    loop = asyncio.get_running_loop()
+    t_first = loop.time()
+    info["ttfb"] = t_first - t0
+    hls = "mpegurl" in ct or ".m3u8" in url
+    cap = PLAYLIST_BYTES if hls else SAMPLE_BYTES
+    body = bytearray(first)
+    while len(body) < cap:
+        left = t_first + SAMPLE_SECS - loop.time()
+        if left <= 0:
+            break
+        try:
+            chunk = await asyncio.wait_for(r.content.read(cap - len(body)), left)
+        except asyncio.TimeoutError:
+            break
+        if not chunk:
+            break
+        body += chunk
+    if hls:
+        info.update(hls_master_quality(body.decode("utf-8", errors="replace"), str(r.url)))
+    elif len(body) >= 8192:  # too little data says nothing about throughput
+        secs = max(loop.time() - t_first, 1e-3)
+        info["kbps"] = 8 * (len(body) - len(first)) / 1000 / secs
+
+
+async def _probe_once(session, limiter, url, headers, kind, info=None):
+    """One probe of the given kind; tri-state result, _UNSUPPORTED or _SKIPPED.
+    info, if given, receives the HTTP status and latency (to headers)."""
+    import aiohttp
+    throttle = limiter.host(url)
+    method = "HEAD" if kind == "head" else "GET"
+    if kind == "range":
+        headers = dict(headers, Range=RANGE_HEADER)
+    loop = asyncio.get_running_loop()
+    result = False
+    for _ in range(PROBE_RETRIES + 1):
+        # host slot first: waiting on a busy host must not hold a global slot
+        await throttle.acquire()
+        if throttle.should_skip():
+            await throttle.release("skipped")
+            return _SKIPPED  # host is down: not worth a full timeout
+        outcome, retry_after, result, nbytes = "error", None, False, 0
+        t0 = None
+        try:
+            async with limiter.sem:
+                t0 = loop.time()  # not before: time queued for a slot is not latency
+                async with session.request(method, url, headers=headers,
+                                           timeout=aiohttp.ClientTimeout(total=CHECK_TIMEOUT),
+                                           allow_redirects=True) as r:
+                    if info is not None:
+                        info["status"], info["latency"] = r.status, loop.time() - t0
+                    ct = r.headers.get("Content-Type", "").lower()
+                    if r.status in THROTTLE_STATUSES:
+                        outcome = "throttle"
+                        retry_after = r.headers.get("Retry-After")
+                        # 429 = host is up and serving, just not to us right now
+                        result = None if r.status == 429 else False
+                    elif (kind == "head" and r.status in (400, 405, 501)) or \
+                            (kind == "range" and r.status == 416):
+                        outcome, result = "ok", _UNSUPPORTED
+                    else:
+                        outcome = "ok"
+                        if r.status in (200, 206) and (
+                            "video" in ct or "mpegurl" in ct or "octet-stream" in ct
+                            or ".m3u8" in url
+                        ):
+                            if method == "GET":
+                                await _sample_body(r, url, ct, info, t0)
+                            result = True
+                        elif r.status in (401, 402, 403):
+                            result = None  # blocked for datacenter IPs, OK for end users
+                    nbytes = r.content.total_bytes
+        except asyncio.TimeoutError:
+            outcome = "timeout"
+        except (aiohttp.ClientConnectorError, aiohttp.ClientSSLError):
+            outcome = "connect"
+        except Exception:
+            pass
+        finally:
+            if t0 is not None:  # else cancelled while queued: nothing was sent
+                _probe_stat(kind, nbytes, loop.time() - t0)
+            await throttle.release(outcome, retry_after)
+        if outcome != "throttle":
+            break
+    return result
+
+
+async def _probe(session, limiter, url, headers, mode="get", info=None):
+    """True = alive | False = clearly dead | None = blocked (geo/DC)
+
+    mode "head-then-get" / "range" try the cheap request first and fall back
+    to a plain GET, remembering hosts that refuse HEAD or Range."""
+    cheap, refused = {
+        "head-then-get": ("head", limiter.no_head),
+        "range": ("range", limiter.no_range),
+    }.get(mode, (None, None))
+    host = url_host(url)
+    if cheap and host not in refused:
+        ok = await _probe_once(session, limiter, url, headers, cheap, info)
+        if ok is not _UNSUPPORTED:
+            return ok
+        refused.add(host)
+    return await _probe_once(session, limiter, url, headers, "get", info)
 
 
-def load_cache():
-    try:
-        with open(CACHE_FILE, "r", encoding="utf-8") as f:
-            data = json.load(f)
-        now = datetime.utcnow().timestamp()
-        return {u: v for u, (v, t) in data.items() if now - t < 48 * 3600}
-    except Exception:
-        return {}
+# =============================================================
+# DEEP HLS CHECK — master -> one variant -> media playlist -> one segment
+# =============================================================
+
+# outcome -> count: alive | dead | blocked | inconclusive
+DEEP_STATS = {}
+_HLS_ATTR_RE = re.compile(r'([A-Z0-9-]+)=("[^"]*"|[^,]*)')
+_FMP4_BOXES = (b"ftyp", b"styp", b"moof", b"sidx", b"moov", b"emsg", b"free")
+
+
+def _hls_attrs(line):
+    return {k: v.strip('"') for k, v in _HLS_ATTR_RE.findall(line.split(":", 1)[-1])}
+
+
+def parse_hls_master(text, base_url):
+    """Variants of a master playlist: [{'bandwidth', 'resolution', 'url'}]"""
+    variants, pending = [], None
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line.startswith("#EXT-X-STREAM-INF"):
+            attrs = _hls_attrs(line)
+            try:
+                bw = int(attrs.get("BANDWIDTH", "0"))
+            except ValueError:
+                bw = 0
+            pending = {"bandwidth": bw, "resolution": attrs.get("RESOLUTION", "")}
+        elif line and not line.startswith("#") and pending is not None:
+            pending["url"] = urljoin(base_url, line)
+            variants.append(pending)
+            pending = None
+    return variants
+
+
+def hls_master_quality(text, base_url):
+    """{'bandwidth', 'height'} of the best variant in a master playlist,
+    {} if text is not a master or declares neither"""
+    out = {}
+    for v in parse_hls_master(text, base_url):
+        if v["bandwidth"]:
+            out["bandwidth"] = max(out.get("bandwidth", 0), v["bandwidth"])
+        height = v["resolution"].partition("x")[2]
+        if height.isdigit():
+            out["height"] = max(out.get("height", 0), int(height))
+    return out
 
 
-def save_cache(cache):
+def parse_hls_media(text, base_url):
+    """(media sequence, [segment urls], encrypted) of a media playlist"""
+    seq, segments, encrypted, in_seg = 0, [], False, False
+    for raw in text.splitlines():
+        line = raw.strip()
+        if line.startswith("#EXT-X-MEDIA-SEQUENCE:"):
+            try:
+                seq = int(line.split(":", 1)[1])
+            except ValueError:
+                pass
+        elif line.startswith("#EXT-X-KEY"):
+            encrypted = _hls_attrs(line).get("METHOD", "NONE") != "NONE"
+        elif line.startswith("#EXTINF"):
+            in_seg = True
+        elif line and not line.startswith("#") and in_seg:
+            segments.append(urljoin(base_url, line))
+            in_seg = False
+    return seq, segments, encrypted
+
+
+def sniff_segment(head):
+    """True if the first bytes look like MPEG-TS, fMP4 or packed audio"""
+    if head[:1] == b"\x47" and (len(head) <= 188 or head[188:189] == b"\x47"):
+        return True  # TS sync byte, repeated every 188-byte packet
+    if len(head) >= 8 and head[4:8] in _FMP4_BOXES:
+        return True
+    if head[:3] == b"ID3":
+        return True  # AAC / MP3 segments with ID3 timestamps
+    return len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF0 == 0xF0  # ADTS
+
+
+class _BudgetExceeded(Exception):
+    pass
+
+
+class _HostBusy(Exception):
+    """A deep GET met a throttle status (args[0]) or an open breaker (None)"""
+
+
+async def _deep_get(session, limiter, url, headers, budget, limit=None):
+    """(status, final url, body); budget[0] is the bytes still allowed.
+    Without a limit the whole body is wanted and must fit the budget.
+    Takes a slot of the host's HostThrottle like any probe and feeds its
+    backoff and breaker; a throttle answer or open breaker raises _HostBusy."""
+    import aiohttp
+    cap = budget[0] if limit is None else min(limit, budget[0])
+    if cap <= 0:
+        raise _BudgetExceeded
+    throttle = limiter.host(url)
+    await throttle.acquire()
+    if throttle.should_skip():
+        await throttle.release("skipped")
+        raise _HostBusy(None)
+    outcome, retry_after = "error", None
     try:
-        with open(CACHE_FILE, "w", encoding="utf-8") as f:
-            json.dump({u: (v, datetime.utcnow().timestamp()) for u, v in cache.items()}, f)
-    except Exception as e:
-        print("CACHE SAVE ERROR:", e)
+        async with session.get(url, headers=headers, allow_redirects=True) as r:
+            if r.status in THROTTLE_STATUSES:
+                outcome, retry_after = "throttle", r.headers.get("Retry-After")
+                raise _HostBusy(r.status)
+            outcome = "ok"
+            body = b""
+            while r.status in (200, 206) and len(body) < cap:
+                chunk = await r.content.read(cap - len(body))
+                if not chunk:
+                    break
+                body += chunk
+            budget[0] -= len(body)
+            if limit is None and len(body) >= cap and not r.content.at_eof():
+                raise _BudgetExceeded
+            return r.status, str(r.url), body
+    except asyncio.TimeoutError:
+        outcome = "timeout"
+        raise
+    except (aiohttp.ClientConnectorError, aiohttp.ClientSSLError):
+        outcome = "connect"
+        raise
+    finally:
+        await throttle.release(outcome, retry_after)
+
+
+async def _deep_check(session, limiter, url, headers, info):
+    budget = [DEEP_BYTE_BUDGET]
+    status, final, body = await _deep_get(session, limiter, url, headers, budget)
+    if status in (401, 402, 403):
+        return None
+    if status != 200:
+        return False
+    text = body.decode("utf-8", errors="replace")
+    if "#EXT-X-STREAM-INF" in text:
+        variants = parse_hls_master(text, final)
+        if not variants:
+            return False
+        cheapest = min(variants, key=lambda v: v["bandwidth"] or float("inf"))
+        status, final, body = await _deep_get(session, limiter, cheapest["url"], headers,
+                                              budget)
+        if status in (401, 402, 403):
+            return None
+        if status != 200:
+            return False
+        text = body.decode("utf-8", errors="replace")
+    _, segments, encrypted = parse_hls_media(text, final)
+    if not segments:
+        return False
+    # newest segment: the one a player would start from
+    # and a throughput sample from it: real video, unlike the playlist
+    seg_headers = dict(headers, Range=f"bytes=0-{SAMPLE_BYTES - 1}")
+    loop = asyncio.get_running_loop()
+    t0 = loop.time()
+    status, _, head = await _deep_get(session, limiter, segments[-1], seg_headers, budget,
+                                      SAMPLE_BYTES)
+    if status in (401, 402, 403):
+        return None
+    if status not in (200, 206) or not head:
+        return False
+    if info is not None and len(head) >= 8192:
+        info["kbps"] = 8 * len(head) / 1000 / max(loop.time() - t0, 1e-3)
+    return True if encrypted else sniff_segment(head)
+
+
+async def deep_check_hls(session, limiter, url, headers, info=None):
+    """True / False / None like _probe, or "inconclusive" when the time or
+    byte budget ran out, or the host throttled us, before the check could
+    decide (429 counts as blocked, the way the quick probe has it)"""
+    async with limiter.deep:
+        try:
+            ok = await asyncio.wait_for(_deep_check(session, limiter, url, headers, info),
+                                        DEEP_TIME_BUDGET)
+        except (_BudgetExceeded, asyncio.TimeoutError):
+            ok = "inconclusive"
+        except _HostBusy as e:
+            ok = None if e.args[0] == 429 else "inconclusive"
+        except Exception:
+            ok = False
+    key = {True: "alive", False: "dead", None: "blocked"}.get(ok, "inconclusive")
+    DEEP_STATS[key] = DEEP_STATS.get(key, 0) + 1
+    return ok
+
+
+async def _verify(session, limiter, url, headers, mode="get", info=None):
+    ok = await _probe(session, limiter, url, headers, mode, info)
+    if ok is True and DEEP_HLS and ".m3u8" in url.lower():
+        deep = await deep_check_hls(session, limiter, url, headers, info)
+        if deep != "inconclusive":
+            ok = deep
+        elif mode == "head-then-get" and "ttfb" not in (info or {}):
+            # inconclusive after a HEAD: no body byte was seen at all, and a
+            # stalled stream looks just like that -> let a plain GET decide
+            ok = await _probe(session, limiter, url, headers, "get", info)
+        # otherwise out of budget or throttled: keep the quick answer
+    return ok
+
+
+async def check_stream(session, session_vlc, limiter, url):
+    """(outcome, info): outcome True = alive | None = blocked | False = dead;
+    info holds the deciding probe's HTTP status, latency, ttfb and, when
+    measured, kbps / HLS bandwidth / height (empty when nothing answered);
+    None when the URL was not probed at all: IPTV_SKIP_CHECK, or outcome
+    _SKIPPED because its host's breaker is open"""
+    if SKIP_CHECK:
+        return True, None
+    info = {}
+    ok = await _verify(session, limiter, url, HEADERS, PROBE_MODE, info)
+    if ok is _SKIPPED:
+        limiter.host(url).skipped += 1
+        return ok, None
+    if ok is not False:
+        return ok, info
+    # retry with VLC fingerprint (plain GET) — some servers only serve players
+    retry = await _verify(session_vlc, limiter, url, VLC_HEADERS, info=info)
+    # breaker opened in between: the failed first probe stands
+    return (False if retry is _SKIPPED else retry), info
+
+# =============================================================
+# PROBE RESULT STORE (SQLite)
+# =============================================================
+
+# Re-check interval grows with a URL's streak of same results: dead URLs
+# back off as RECHECK_BASE * 2**(streak-1), live ones one step later (a live
+# URL must pass twice before any run skips it); each kind has its own cap.
+# New or just-flipped URLs (streak 1) are always due on the next 3-day run.
+RECHECK_BASE      = float(os.getenv("RECHECK_BASE_HOURS", "36")) * 3600
+RECHECK_MAX_ALIVE = float(os.getenv("RECHECK_MAX_ALIVE_HOURS", "168")) * 3600
+RECHECK_MAX_DEAD  = float(os.getenv("RECHECK_MAX_DEAD_HOURS", "720")) * 3600
+_OUTCOME_CODE = {True: 1, False: 0, None: -1}
+_CODE_OUTCOME = {1: True, 0: False, -1: None}
+
+
+def recheck_interval(url, dead, streak):
+    """Seconds a stored result stays valid. A fixed per-URL jitter of
+    +-15% keeps URLs that settled together from all coming due together."""
+    cap = RECHECK_MAX_DEAD if dead else RECHECK_MAX_ALIVE
+    steps = max(streak, 1) - (1 if dead else 2)
+    jitter = int(hashlib.md5(url.encode("utf-8")).hexdigest()[:4], 16) / 0xFFFF
+    interval = RECHECK_BASE * 2 ** min(max(steps, 0), 16) * (0.85 + 0.3 * jitter)
+    return min(interval, cap)
+
+
+def probe_priority(ch, hist):
+    """Check-queue sort key: Kurdish, Persian, then the genres in GROUP_ORDER;
+    inside a group, new or just-flipped URLs before settled re-checks"""
+    settled = hist is not None and hist["streak"] > 1
+    return GROUP_ORDER.index(ch.group), settled
+
+
+class ProbeStore:
+    """Probe results, one row per URL, in a WAL-mode SQLite file. Writes are
+    buffered and committed in batches; fails counts dead results in a row."""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS probes (
+            url      TEXT PRIMARY KEY,
+            outcome  INTEGER NOT NULL,          -- 1 alive | 0 dead | -1 blocked
+            status   INTEGER,                   -- HTTP status of the deciding probe
+            latency  REAL,                      -- seconds to response headers
+            checked  REAL NOT NULL,             -- unix time of the probe
+            fails    INTEGER NOT NULL DEFAULT 0,
+            source   TEXT,
+            streak   INTEGER NOT NULL DEFAULT 1, -- results in a row, dead vs not
+            ttfb     REAL,                      -- seconds to the first body byte
+            kbps     REAL,                      -- throughput sample
+            bandwidth INTEGER,                  -- top BANDWIDTH of an HLS master
+            height   INTEGER                    -- top RESOLUTION height of it
+        );
+        CREATE INDEX IF NOT EXISTS probes_checked ON probes (checked);
+    """
+    UPSERT = """
+        INSERT INTO probes (url, outcome, status, latency, checked, fails, source,
+                            ttfb, kbps, bandwidth, height)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ON CONFLICT (url) DO UPDATE SET
+            outcome = excluded.outcome, status = excluded.status,
+            latency = excluded.latency, checked = excluded.checked,
+            ttfb = excluded.ttfb, kbps = excluded.kbps,
+            bandwidth = excluded.bandwidth, height = excluded.height,
+            fails = CASE WHEN excluded.outcome = 0 THEN probes.fails + 1 ELSE 0 END,
+            source = COALESCE(excluded.source, probes.source),
+            streak = CASE WHEN (excluded.outcome = 0) = (probes.outcome = 0)
+                          THEN probes.streak + 1 ELSE 1 END
+    """
+    # columns added after the first release of the store
+    ADDED = [("streak", "INTEGER NOT NULL DEFAULT 1"), ("ttfb", "REAL"),
+             ("kbps", "REAL"), ("bandwidth", "INTEGER"), ("height", "INTEGER")]
+    METRICS = ("latency", "ttfb", "kbps", "bandwidth", "height")
+    BATCH = 200             # rows per commit
+    CHECKPOINT_SECS = 30    # ...or sooner, when this long has passed
+
+    def __init__(self, path=PROBE_DB):
+        self.db = sqlite3.connect(path)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.executescript(self.SCHEMA)
+        cols = {row[1] for row in self.db.execute("PRAGMA table_info(probes)")}
+        for col, decl in self.ADDED:
+            if col not in cols:
+                self.db.execute(f"ALTER TABLE probes ADD COLUMN {col} {decl}")
+        self.pending = []
+        self.flushed_at = time.monotonic()
+        if not self.db.execute("SELECT 1 FROM probes LIMIT 1").fetchone():
+            self.migrate_json(CACHE_FILE)
+
+    def migrate_json(self, path):
+        """One-off import of the old {url: [ok, time]} check_cache.json.
+        The file is no longer written: results older than the longest
+        re-check interval are left out, or a run with an empty store would
+        fall back on outcomes that are months old."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except Exception:
+            return
+        oldest = datetime.utcnow().timestamp() - max(RECHECK_MAX_ALIVE, RECHECK_MAX_DEAD)
+        rows = [(u, _OUTCOME_CODE[bool(v)], None, None, t, 0 if v else 1, None,
+                 None, None, None, None)
+                for u, (v, t) in data.items() if t >= oldest]
+        with self.db:
+            self.db.executemany(self.UPSERT, rows)
+        print("PROBE STORE: migrated", len(rows), "results from", path,
+              f"({len(data) - len(rows)} too old)")
+
+    def lookup(self, urls):
+        """url -> {'outcome', 'streak', 'due', 'metrics'} for the urls with a
+        stored result; due = its re-check interval has run out"""
+        now = datetime.utcnow().timestamp()
+        urls, out = list(urls), {}
+        for i in range(0, len(urls), 500):
+            part = urls[i:i + 500]
+            q = ("SELECT url, outcome, checked, streak, %s FROM probes WHERE url IN (%s)"
+                 % (", ".join(self.METRICS), ",".join("?" * len(part))))
+            for url, code, checked, streak, *metrics in self.db.execute(q, part):
+                out[url] = {
+                    "outcome": _CODE_OUTCOME[code], "streak": streak,
+                    "due": now - checked >= recheck_interval(url, code == 0, streak),
+                    "metrics": {k: v for k, v in zip(self.METRICS, metrics)
+                                if v is not None},
+                }
+        return out
+
+    def put(self, url, outcome, info, source=None):
+        """Store one probe; info as filled in by check_stream()"""
+        fails = 1 if outcome is False else 0
+        self.pending.append((url, _OUTCOME_CODE[outcome], info.get("status"),
+                             info.get("latency"), datetime.utcnow().timestamp(),
+                             fails, source, info.get("ttfb"), info.get("kbps"),
+                             info.get("bandwidth"), info.get("height")))
+        if (len(self.pending) >= self.BATCH
+                or time.monotonic() - self.flushed_at >= self.CHECKPOINT_SECS):
+            self.flush()
+
+    def flush(self):
+        self.flushed_at = time.monotonic()
+        if not self.pending:
+            return
+        try:
+            with self.db:
+                self.db.executemany(self.UPSERT, self.pending)
+        except sqlite3.Error as e:
+            print("PROBE STORE SAVE ERROR:", e)
+        self.pending = []
+
+    def close(self):
+        self.flush()
+        self.db.close()
 
 # =============================================================
 # BUILD
 # =============================================================
 
-async def build_playlist():
-    db = await asyncio.to_thread(load_db)
+STARTUP_STEP = 0.25  # seconds; startup times this close rank as equal
 
-    raw = []
-    for source in SOURCES:
-        print("SOURCE:", source)
-        content = await asyncio.to_thread(download, source)
-        if not content:
-            continue
-        parsed = parse_m3u(content, source)
-        print("  parsed:", len(parsed))
-        raw.extend(parsed)
 
-    raw.extend(await asyncio.to_thread(scrape_kurdtvs))
-    raw.extend(dict(c) for c in SEED_CHANNELS)
+async def build_playlist():
+    import aiohttp
+    db, raw = await ingest()
+    raw.extend(Channel(c["name"], c["url"], c["source"], c["attrs"])
+               for c in SEED_CHANNELS)
     print("RAW TOTAL:", len(raw))
 
+    st = stage_begin("dedupe")
     # dedupe by URL only — name-dedupe happens AFTER the health check,
     # so a live stream is never dropped in favour of a dead duplicate
     seen_urls, unique = set(), []
     for ch in raw:
-        u = normalize_url(ch["url"])
+        u = normalize_url(ch.url)
         if u in seen_urls:
             continue
         seen_urls.add(u)
-        ch["name"] = clean_name(ch["name"])
+        ch.name = clean_name(ch.name)
         unique.append(ch)
     print("DEDUPED:", len(unique))
-
-    # classify
+    stage_end(st, len(unique))
+
+    # classify (memoized across runs by channel fingerprint)
+    st = stage_begin("classify")
+    prev, memo = load_classify_cache(), {}
+    fps = [classify_fingerprint(ch, db) for ch in unique]
+    misses = [i for i, fp in enumerate(fps) if fp not in prev]
+    fresh = await classify_many([unique[i] for i in misses], db)
+    fresh = {fps[i]: r for i, r in zip(misses, fresh)}
     kept = []
-    for ch in unique:
-        group, sats = classify(ch, db)
+    for ch, fp in zip(unique, fps):
+        hit = prev.get(fp) or fresh[fp]
+        memo[fp] = hit
+        group, sats = hit
         if group != "DROP":
-            ch["group"] = group
-            ch["satellites"] = sorted(sats)
+            ch.group = _intern(group)
+            ch.satellites = sorted(sats)  # stable order: output versions hash it
             kept.append(ch)
+    hits = sum(1 for fp in memo if fp in prev)
+    print("CLASSIFY CACHE:", hits, "/", len(memo), "hits")
+    save_classify_cache(memo)
     print("KEPT (target):", len(kept))
-
-    # stream check (with cache)
-    cache = load_cache()
-    sem = asyncio.Semaphore(CONCURRENCY)
+    stage_end(st, len(unique))
+
+    # stream check (with stored results)
+    st = stage_begin("probe")
+    store = ProbeStore()
+    history = store.lookup({ch.url for ch in kept})
+    metrics = {u: h["metrics"] for u, h in history.items()}  # fresh probes overwrite
+    limiter = ProbeLimiter(CONCURRENCY)
     conn = aiohttp.TCPConnector(limit=CONCURRENCY)
     async with aiohttp.ClientSession(connector=conn) as session, \
                aiohttp.ClientSession(connector=conn) as session_vlc:
         todo_idx, results = [], {}
         for i, ch in enumerate(kept):
-            if ch["url"] in cache:
-                results[i] = cache[ch["url"]]
+            hist = history.get(ch.url)
+            if hist and not hist["due"]:
+                results[i] = hist["outcome"]
             else:
                 todo_idx.append(i)
+        # probes start in queue order, so the important groups go first
+        todo_idx.sort(key=lambda i: probe_priority(kept[i], history.get(kept[i].url)))
         if IPTV_LIMIT > 0:
             todo_idx = todo_idx[:IPTV_LIMIT]
             for i in set(range(len(kept))) - set(results) - set(todo_idx):
@@ -1461,42 +1848,116 @@ async def build_playlist():
             results = {i: True for i in range(len(kept))}
             todo_idx = []
         print("CHECKING:", len(todo_idx), "streams (cached:", len(results), ")")
-        tasks = {
-            i: asyncio.create_task(check_stream(
-                session, session_vlc, sem, kept[i]["url"],
-                trust=kept[i]["source"] in TRUSTED_SOURCES))
-            for i in todo_idx
-        }
-        done = 0
-        for i, t in tasks.items():
-            ok = await t
-            results[i] = ok
-            cache[kept[i]["url"]] = ok
-            done += 1
-            if done % 200 == 0:
-                print(f"  checked {done}/{len(tasks)}")
-    save_cache(cache)
-
-    alive = [ch for i, ch in enumerate(kept) if results.get(i)]
+        st["items"] = len(todo_idx)
+
+        async def run(i):
+            return i, await check_stream(session, session_vlc, limiter, kept[i].url)
+
+        def last_known(i):
+            # not checked this run: the stored result stands; never-checked
+            # URLs stay out rather than being trusted blindly
+            hist = history.get(kept[i].url)
+            results[i] = hist["outcome"] if hist else False
+            return "unknown" if not hist else "dead" if hist["outcome"] is False else "alive"
+
+        # handle results as they finish; the store checkpoints to disk as it
+        # goes, so an interrupted run leaves its finished probes for the next
+        tasks = [asyncio.create_task(run(i)) for i in todo_idx]
+        breaker = {"alive": 0, "dead": 0, "unknown": 0}
+        deadline = dict(breaker)
+        try:
+            done = 0
+            for fut in asyncio.as_completed(tasks, timeout=CHECK_DEADLINE or None):
+                i, (ok, info) = await fut
+                if ok is _SKIPPED:
+                    breaker[last_known(i)] += 1
+                else:
+                    results[i] = ok
+                if info is not None:  # None: skipped, not probed
+                    store.put(kept[i].url, ok, info, kept[i].source)
+                    metrics[kept[i].url] = info
+                done += 1
+                if done % 200 == 0:
+                    print(f"  checked {done}/{len(tasks)}")
+        except asyncio.TimeoutError:
+            late = [i for i in todo_idx if i not in results]
+            for i in late:
+                deadline[last_known(i)] += 1
+            print(f"DEADLINE: {len(late)}/{len(tasks)} probes skipped "
+                  f"({100 * len(late) / max(len(tasks), 1):.0f}%) -> last known: "
+                  + ", ".join(f"{k} {v}" for k, v in deadline.items()))
+        finally:
+            for t in tasks:
+                t.cancel()
+            store.close()
+            # let them unwind before the sessions close and the stats print
+            await asyncio.gather(*tasks, return_exceptions=True)
+        CHECK_STATS.update(queued=len(tasks), deadline=deadline, breaker=breaker)
+    stage_end(st)
+    for kind, ps in sorted(PROBE_STATS.items()):
+        print(f"PROBES [{kind}]: {ps['probes']}, {ps['bytes'] / 1e6:.1f} MB body, "
+              f"avg {1000 * ps['seconds'] / max(ps['probes'], 1):.0f} ms")
+    if DEEP_STATS:
+        print("DEEP HLS:", ", ".join(f"{k}={v}" for k, v in sorted(DEEP_STATS.items())))
+    throttled = limiter.report()
+    if throttled:
+        print("THROTTLED HOSTS:", ", ".join(f"{h} ({n})" for h, n in throttled[:10]))
+    tripped = limiter.tripped()
+    if tripped:
+        print("HOSTS DOWN (breaker):", ", ".join(f"{h} (skipped {n})" for h, n in tripped))
+        print(f"BREAKER: {sum(breaker.values())} URLs skipped -> last known: "
+              + ", ".join(f"{k} {v}" for k, v in breaker.items()))
+
+    # trusted sources are probed like the rest, so their candidates are
+    # measured and ranked; a channel whose candidates all failed keeps its
+    # first one anyway, as unverified (None), behind any stream seen playing
+    trusted = {}
+    for i, ch in enumerate(kept):
+        if ch.source in TRUSTED_SOURCES:
+            trusted.setdefault(dedupe_key(ch.name) or dedupe_key(ch.url), []).append(i)
+    rescued = [idx[0] for idx in trusted.values()
+               if all(results.get(i, False) is False for i in idx)]
+    for i in rescued:
+        results[i] = None
+    if rescued:
+        print("TRUSTED FALLBACK:", len(rescued), "of", len(trusted),
+              "channels kept unverified")
+
+    # blocked (None) counts as alive: fine for end users, just not for us
+    st = stage_begin("rank")
+    alive = [(ch, results[i]) for i, ch in enumerate(kept)
+             if results.get(i, False) is not False]
     print("ALIVE:", len(alive))
 
-    # name-dedupe among alive channels, preferring curated sources & higher res
+    # name-dedupe among alive channels, preferring streams seen playing over
+    # blocked ones, then curated sources, then the fastest measured startup
+    # (time to the first body byte; a header-only answer measured none),
+    # then higher resolution / throughput
     def res_of(name):
         m = re.search(r"(\d{3,4})p", name)
         return int(m.group(1)) if m else 0
 
     src_prio = {"seed": 0, "kurdtvs.net": 1}
     best = {}
-    for ch in alive:
-        k = dedupe_key(ch["name"]) or dedupe_key(ch["url"])
-        score = (src_prio.get(ch["source"], 2), -res_of(ch["name"]), len(ch["name"]))
+    for ch, ok in alive:
+        k = dedupe_key(ch.name) or dedupe_key(ch.url)
+        m = metrics.get(ch.url, {})
+        ttfb = m.get("ttfb")
+        score = (ok is not True,
+                 src_prio.get(ch.source, 2),
+                 # 250 ms steps: near-ties are decided by quality instead
+                 int(ttfb / STARTUP_STEP) if ttfb is not None else float("inf"),
+                 -(m.get("height") or res_of(ch.name)),
+                 -(m.get("kbps") or m.get("bandwidth", 0) / 1000),
+                 len(ch.name))
         if k not in best or score < best[k][0]:
             best[k] = (score, ch)
     final = [v[1] for v in best.values()]
     print("AFTER NAME-DEDUPE:", len(final))
 
     order = {g: n for n, g in enumerate(GROUP_ORDER)}
-    final.sort(key=lambda c: (order[c["group"]], dedupe_key(c["name"])))
+    final.sort(key=lambda c: (order[c.group], dedupe_key(c.name)))
+    stage_end(st, len(final))
     return final
 
 # =============================================================
@@ -1504,22 +1965,52 @@ async def build_playlist():
 # =============================================================
 
 def make_extinf(ch):
-    attrs = ch["attrs"]
     parts = ["#EXTINF:-1"]
-    if attrs.get("tvg-id"):
-        parts.append(f'tvg-id="{attrs["tvg-id"]}"')
-    if attrs.get("tvg-name"):
-        parts.append(f'tvg-name="{attrs["tvg-name"]}"')
-    logo = attrs.get("tvg-logo") or BRAND_LOGO
-    parts.append(f'tvg-logo="{logo}"')
-    if attrs.get("tvg-language"):
-        parts.append(f'tvg-language="{attrs["tvg-language"]}"')
-    parts.append(f'group-title="{ch["group"]}"')
-    return " ".join(parts) + "," + ch["name"]
-
-
-def write_playlist(channels):
-    header = (
+    if ch.tvg_id:
+        parts.append(f'tvg-id="{ch.tvg_id}"')
+    if ch.tvg_name:
+        parts.append(f'tvg-name="{ch.tvg_name}"')
+    parts.append(f'tvg-logo="{ch.tvg_logo or BRAND_LOGO}"')
+    if ch.tvg_language:
+        parts.append(f'tvg-language="{ch.tvg_language}"')
+    parts.append(f'group-title="{ch.group}"')
+    return " ".join(parts) + "," + ch.name
+
+
+def _write_atomic(path, data):
+    """Replace path in one step: readers never see a half-written file"""
+    tmp = path + ".tmp"
+    if isinstance(data, str):
+        data = data.encode("utf-8")
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _write_encoded(path, text):
+    """Write path plus its .gz / .br siblings for static hosts to pick the
+    smallest encoding from; returns {encoding: size}"""
+    raw = text.encode("utf-8")
+    sizes = {"identity": len(raw)}
+    _write_atomic(path, raw)
+    gz = gzip.compress(raw, 9, mtime=0)  # mtime=0: same input, same bytes
+    _write_atomic(path + ".gz", gz)
+    sizes["gzip"] = len(gz)
+    if brotli is not None:
+        br = brotli.compress(raw, quality=11)
+        _write_atomic(path + ".br", br)
+        sizes["br"] = len(br)
+    elif os.path.exists(path + ".br"):
+        os.remove(path + ".br")  # would be stale
+    return sizes
+
+
+def _slug(name):
+    return re.sub(r"[^a-z0-9]+", "-", name.lower()).strip("-")
+
+
+def _playlist_header(now):
+    return (
         "#EXTM3U\n"
         "# +======================================+\n"
         "#   Anon TV — by Aram Moostafaye\n"
@@ -1527,50 +2018,204 @@ def write_playlist(channels):
         "#   https://github.com/arammoostafaye/Iptv\n"
         "#   Updated: {ts} UTC\n"
         "# +======================================+\n"
-    ).format(ts=datetime.utcnow().strftime("%Y-%m-%d %H:%M"))
-
-    content = header + "\n".join(
-        f"{make_extinf(ch)}\n{ch['url']}" for ch in channels
-    ) + "\n"
-
-    old_hash = None
-    if os.path.exists(OUTPUT_FILE):
-        with open(OUTPUT_FILE, "rb") as f:
-            old_hash = hashlib.md5(f.read()).hexdigest()
-    new_hash = hashlib.md5(content.encode("utf-8")).hexdigest()
-    updated = old_hash != new_hash
-
-    with open(OUTPUT_FILE, "w", encoding="utf-8") as f:
-        f.write(content)
-
-    data = [{
-        "name": ch["name"],
-        "group": ch["group"],
-        "stream": ch["url"],
-        "logo": ch["attrs"].get("tvg-logo") or BRAND_LOGO,
-        "tvg_id": ch["attrs"].get("tvg-id", ""),
-        "satellites": ch["satellites"],
-    } for ch in channels]
+    ).format(ts=now.strftime("%Y-%m-%d %H:%M"))
+
+
+def write_splits(splits, now):
+    """Write SPLIT_DIR/<kind>/<slug>.m3u (+ .gz/.br) for each
+    (kind, name) -> entries and an index.json listing them; files of
+    groups / languages that are gone are removed"""
+    header = _playlist_header(now)
+    index, written = [], set()
+    for (kind, name), entries in sorted(splits.items()):
+        os.makedirs(os.path.join(SPLIT_DIR, kind), exist_ok=True)
+        rel = f"{kind}/{_slug(name)}.m3u"
+        text = header + "".join(entries)
+        sizes = _write_encoded(os.path.join(SPLIT_DIR, rel), text)
+        written.update(rel + ext for ext in ("", ".gz", ".br"))
+        index.append({
+            "kind": kind, "name": name, "path": rel, "channels": len(entries),
+            "sha1": hashlib.sha1(text[len(header):].encode("utf-8")).hexdigest(),
+            "sizes": sizes,
+        })
+    for kind in ("group", "language"):
+        folder = os.path.join(SPLIT_DIR, kind)
+        for fn in os.listdir(folder) if os.path.isdir(folder) else ():
+            if f"{kind}/{fn}" not in written:
+                os.remove(os.path.join(folder, fn))
+    _write_atomic(os.path.join(SPLIT_DIR, "index.json"), json.dumps({
+        "updated": now.isoformat(),
+        "playlists": index,
+    }, indent=2, ensure_ascii=False))
+
+
+def _load_previous():
+    """(version, {id: record}, [ids in order]) of the last channels.json;
+    outputs from before stable IDs get theirs computed from the record"""
+    try:
+        with open(OUTPUT_JSON, "r", encoding="utf-8") as f:
+            prev = json.load(f)
+    except (OSError, ValueError):
+        return None, {}, []
+    records, order = {}, []
+    for rec in prev.get("channels", []):
+        cid = rec.get("id") or channel_id(rec["name"], rec["stream"])
+        records[cid] = {k: v for k, v in rec.items() if k != "id"}
+        order.append(cid)
+    return prev.get("version"), records, order
+
+
+def _api_page(cids, records):
+    """One API page, columnar: a list per field, with logos, groups and
+    satellites as indexes into the page's own string tables (so a page's
+    hash only moves when its own channels do)"""
+    tables = {"logo": [], "group": [], "satellite": []}
+    slots = {name: {} for name in tables}
+
+    def ref(table, value):
+        slot = slots[table].get(value)
+        if slot is None:
+            slot = slots[table][value] = len(tables[table])
+            tables[table].append(value)
+        return slot
+
+    recs = [records[cid] for cid in cids]
+    return {
+        "tables": tables,
+        "id": list(cids),
+        "name": [r["name"] for r in recs],
+        "group": [ref("group", r["group"]) for r in recs],
+        "stream": [r["stream"] for r in recs],
+        "logo": [ref("logo", r["logo"]) for r in recs],
+        "tvg_id": [r["tvg_id"] for r in recs],
+        "satellites": [[ref("satellite", x) for x in r["satellites"]] for r in recs],
+    }
+
+
+def write_api(records, order, counts, version, now):
+    """API_DIR/<group>-<n>.json pages of API_PAGE_SIZE channels, paged per
+    group so a change in one group leaves the others' pages (and hashes)
+    alone, and an index.json with group counts and per-page sha1s"""
+    os.makedirs(API_DIR, exist_ok=True)
+    by_group = {}
+    for cid in order:
+        by_group.setdefault(records[cid]["group"], []).append(cid)
+    pages, written = [], {"index.json"}
+    for group, cids in by_group.items():
+        for n, i in enumerate(range(0, len(cids), API_PAGE_SIZE), 1):
+            fn = f"{_slug(group)}-{n}.json"
+            page = json.dumps(_api_page(cids[i:i + API_PAGE_SIZE], records),
+                              ensure_ascii=False, separators=(",", ":"))
+            _write_atomic(os.path.join(API_DIR, fn), page)
+            written.add(fn)
+            pages.append({
+                "path": fn, "group": group,
+                "channels": len(cids[i:i + API_PAGE_SIZE]),
+                "sha1": hashlib.sha1(page.encode("utf-8")).hexdigest(),
+            })
+    for fn in os.listdir(API_DIR):
+        if fn not in written:
+            os.remove(os.path.join(API_DIR, fn))
+    _write_atomic(os.path.join(API_DIR, "index.json"), json.dumps({
+        "updated": now.isoformat(),
+        "version": version,
+        "total": len(order),
+        "groups": counts,
+        "page_size": API_PAGE_SIZE,
+        "pages": pages,
+    }, ensure_ascii=False, separators=(",", ":")))
 
-    counts = {}
-    for ch in channels:
-        counts[ch["group"]] = counts.get(ch["group"], 0) + 1
 
-    with open(OUTPUT_JSON, "w", encoding="utf-8") as f:
-        json.dump({
-            "updated": datetime.utcnow().isoformat(),
-            "total": len(data),
-            "groups": counts,
-            "channels": data,
-        }, f, indent=2, ensure_ascii=False)
+def write_playlist(channels):
+    """Write list.m3u, the split playlists, channels.json, the paged API
+    and the delta manifest; only when the content (timestamps aside)
+    changed. Returns whether it did."""
+    # one pass: each entry is rendered once and shared by the full list,
+    # its group's playlist and its languages' playlists
+    st = stage_begin("render")
+    entries, splits = [], {}
+    records, order = {}, []
+    for ch in channels:
+        entry = f"{make_extinf(ch)}\n{ch.url}\n"
+        entries.append(entry)
+        splits.setdefault(("group", ch.group), []).append(entry)
+        langs = {l.strip() for l in ch.tvg_language.split(";")}
+        for lang in langs:
+            if _slug(lang):
+                splits.setdefault(("language", lang), []).append(entry)
+        cid = channel_id(ch.name, ch.url)
+        records[cid] = {
+            "name": ch.name,
+            "group": ch.group,
+            "stream": ch.url,
+            "logo": ch.tvg_logo or BRAND_LOGO,
+            "tvg_id": ch.tvg_id,
+            "satellites": ch.satellites,
+        }
+        order.append(cid)
+
+    body = "".join(entries)
+    h = hashlib.sha1(body.encode("utf-8"))
+    h.update(json.dumps([[cid, records[cid]] for cid in order], sort_keys=True,
+                        ensure_ascii=False).encode("utf-8"))
+    version = h.hexdigest()[:16]
+
+    old_version, old_records, old_order = _load_previous()
+    stage_end(st, len(channels))
+    if version == old_version and os.path.exists(OUTPUT_FILE) and \
+            os.path.exists(os.path.join(SPLIT_DIR, "index.json")) and \
+            os.path.exists(os.path.join(API_DIR, "index.json")):
+        print("OUTPUT: unchanged", version)
+        return False
+
+    now = datetime.utcnow()
+    st = stage_begin("write m3u")
+    _write_encoded(OUTPUT_FILE, _playlist_header(now) + body)
+    write_splits(splits, now)
+    stage_end(st, 1 + len(splits))
 
-    return updated
+    counts = {}
+    for ch in channels:
+        counts[ch.group] = counts.get(ch.group, 0) + 1
+
+    st = stage_begin("write json")
+    _write_atomic(OUTPUT_JSON, json.dumps({
+        "updated": now.isoformat(),
+        "version": version,
+        "total": len(records),
+        "groups": counts,
+        "channels": [dict(id=cid, **records[cid]) for cid in order],
+    }, indent=2, ensure_ascii=False))
+    write_api(records, order, counts, version, now)
+
+    # delta against the previous output: full records for added / changed,
+    # bare IDs for removed; order only when channels present in both moved
+    # relative to each other (adds and removals alone do not count)
+    delta = {
+        "updated": now.isoformat(),
+        "from": old_version,
+        "to": version,
+        "added": [dict(id=cid, **records[cid]) for cid in order if cid not in old_records],
+        "removed": [cid for cid in old_order if cid not in records],
+        "changed": [dict(id=cid, **records[cid]) for cid in order
+                    if cid in old_records and old_records[cid] != records[cid]],
+    }
+    if [cid for cid in order if cid in old_records] != \
+            [cid for cid in old_order if cid in records]:
+        delta["order"] = order
+    _write_atomic(OUTPUT_DELTA, json.dumps(delta, ensure_ascii=False,
+                                           separators=(",", ":")))
+    stage_end(st, len(records))
+    print("OUTPUT:", old_version, "->", version,
+          f"+{len(delta['added'])} -{len(delta['removed'])} ~{len(delta['changed'])}")
+    return True
 
 # =============================================================
 # TELEGRAM  (settings unchanged)
 # =============================================================
 
 async def send_telegram(channels, updated):
+    import aiohttp
     if not TELEGRAM_TOKEN or not TELEGRAM_CHAT_ID:
         print("TELEGRAM CONFIG MISSING")
         return
@@ -1580,8 +2225,8 @@ async def send_telegram(channels, updated):
     grouped = {g: [] for g in GROUP_ORDER}
     sat_count = {}
     for ch in channels:
-        grouped[ch["group"]].append(ch["name"])
-        for s in ch["satellites"]:
+        grouped[ch.group].append(ch.name)
+        for s in ch.satellites:
             sat_count[s] = sat_count.get(s, 0) + 1
 
     message = (
@@ -1624,19 +2269,38 @@ async def send_telegram(channels, updated):
 # =============================================================
 
 async def main():
-    channels = await build_playlist()
-    updated = write_playlist(channels)
-    await send_telegram(channels, updated)
-
-    print("\n=== SUMMARY ===")
-    print("Total channels:", len(channels))
-    counts = {}
-    for ch in channels:
-        counts[ch["group"]] = counts.get(ch["group"], 0) + 1
-    for g in GROUP_ORDER:
-        if g in counts:
-            print(f"  {g}: {counts[g]}")
+    # Actions sends SIGTERM on cancel / timeout: unwind so caches get flushed
+    try:
+        asyncio.get_running_loop().add_signal_handler(
+            signal.SIGTERM, asyncio.current_task().cancel)
+    except (NotImplementedError, RuntimeError):
+        pass  # no signal handlers on this platform / loop
+    started = datetime.utcnow()
+    try:
+        channels = await build_playlist()
+        updated = write_playlist(channels)
+        await timed("telegram", send_telegram(channels, updated))
+
+        print("\n=== SUMMARY ===")
+        print("Total channels:", len(channels))
+        counts = {}
+        for ch in channels:
+            counts[ch.group] = counts.get(ch.group, 0) + 1
+        for g in GROUP_ORDER:
+            if g in counts:
+                print(f"  {g}: {counts[g]}")
+        if CHECK_STATS.get("queued"):
+            queued = CHECK_STATS["queued"]
+            for why in ("deadline", "breaker"):
+                n = sum(CHECK_STATS[why].values())
+                print(f"Unchecked ({why}): {n}/{queued} ({100 * n / queued:.0f}%) -> last known: "
+                      + ", ".join(f"{k} {v}" for k, v in CHECK_STATS[why].items()))
+    finally:
+        if RUN_METRICS:  # an aborted run still reports the stages it got through
+            write_metrics(started)
 
 
 if __name__ == "__main__":
+    if "--metrics" in sys.argv[1:]:
+        RUN_METRICS = True
     asyncio.run(main())